@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+import geopandas as gpd
+
+# Country boundaries shared by the map builders and the validation stage.
+# naturalearth_lowres is read from disk once per process; callers get the same
+# GeoDataFrame back, so they must copy (or reproject) before modifying it.
+
+
+@lru_cache(maxsize=1)
+def load_world():
+    """Natural Earth country boundaries (EPSG:4326), read once and cached."""
+    return gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
@@ -0,0 +1,82 @@
+import numpy as np
+
+# Handling of institutions that share (or nearly share) coordinates.
+#
+# Points are grouped in one pass by snapping lon/lat to a grid, and every member
+# of a group gets a deterministic unit offset: a ring for small groups and a
+# sunflower spiral for large ones. The offsets are stored on the data and each
+# map builder scales them by a radius that suits its own extent.
+
+# Grid size (degrees) used to decide that two points are co-located; 0.001 is ~100 m
+COLOCATION_PRECISION = 0.001
+
+# Groups up to this size are placed on a single ring, larger ones on a spiral
+MAX_RING_SIZE = 8
+
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+
+def assign_colocation_offsets(data, precision=COLOCATION_PRECISION):
+    """Add colocated_group, colocated_size, offset_dx and offset_dy columns to the data."""
+    data = data.copy()
+
+    cells_x = np.floor(data['lon'].to_numpy(dtype=float) / precision)
+    cells_y = np.floor(data['lat'].to_numpy(dtype=float) / precision)
+    keyed = data.assign(_cell_x=cells_x, _cell_y=cells_y)
+
+    groups = keyed.groupby(['_cell_x', '_cell_y'], sort=True, dropna=False)
+    group_id = groups.ngroup().to_numpy()
+    size = groups['lon'].transform('size').to_numpy()
+
+    # Order members by name so offsets do not depend on row order in base.csv
+    order = keyed.assign(_group=group_id).sort_values(['_group', 'Institution'], kind='stable')
+    rank = np.empty(len(data), dtype=int)
+    rank[data.index.get_indexer(order.index)] = order.groupby('_group').cumcount().to_numpy()
+
+    # Ring: evenly spaced angles starting at twelve o'clock
+    ring_angle = np.pi / 2 - 2 * np.pi * rank / np.maximum(size, 1)
+    # Spiral: golden-angle steps, radius growing with the square root of the rank
+    spiral_angle = np.pi / 2 - GOLDEN_ANGLE * rank
+    spiral_radius = np.sqrt((rank + 1) / MAX_RING_SIZE)
+
+    on_ring = size <= MAX_RING_SIZE
+    angle = np.where(on_ring, ring_angle, spiral_angle)
+    radius = np.where(size > 1, np.where(on_ring, 1.0, spiral_radius), 0.0)
+
+    data['colocated_group'] = group_id
+    data['colocated_size'] = size
+    data['offset_dx'] = radius * np.cos(angle)
+    data['offset_dy'] = radius * np.sin(angle)
+
+    stacked = size > 1
+    if stacked.any():
+        print(f"Spread {stacked.sum()} co-located points over {len(np.unique(group_id[stacked]))} locations")
+    return data
+
+
+def displaced_xy(data, radius):
+    """Marker positions with co-located points moved apart by the given radius (degrees)."""
+    x = data.geometry.x.to_numpy()
+    y = data.geometry.y.to_numpy()
+    if 'offset_dx' not in data.columns:
+        return x, y
+    return x + radius * data['offset_dx'].to_numpy(), y + radius * data['offset_dy'].to_numpy()
+
+
+def draw_spider_legs(ax, data, radius, zorder=9):
+    """Thin lines from the true location of each displaced point to its marker."""
+    from matplotlib.collections import LineCollection
+
+    if 'offset_dx' not in data.columns or len(data) == 0:
+        return None
+    moved = (data['colocated_size'] > 1).to_numpy()
+    if not moved.any():
+        return None
+    x, y = displaced_xy(data, radius)
+    segments = np.stack([
+        np.column_stack([data.geometry.x.to_numpy()[moved], data.geometry.y.to_numpy()[moved]]),
+        np.column_stack([x[moved], y[moved]]),
+    ], axis=1)
+    legs = LineCollection(segments, colors='gray', linewidths=0.5, alpha=0.7, zorder=zorder)
+    ax.add_collection(legs)
+    return legs
@@ -1,29 +1,64 @@
+import argparse
+import os
+import sys
+
 import pandas as pd
 import geopandas as gpd
-import matplotlib.pyplot as plt
-import contextily as cx
 import numpy as np
-from matplotlib_scalebar.scalebar import ScaleBar
-from matplotlib.patches import Rectangle
-import matplotlib.patches as mpatches
-import matplotlib.lines as mlines
-import os
 from shapely.geometry import Point
-import matplotlib as mpl
-import matplotlib
-import folium
-from matplotlib.patheffects import withStroke
+from boundaries import load_world
+from colocation import assign_colocation_offsets, displaced_xy, draw_spider_legs
+import density
+import export
+import preview
+from density import draw_density, should_aggregate
+from gazetteer import fill_missing_coordinates
+import insets as insets_module
+from insets import discover_insets
+from layout import color_palette, inset_map_labels, main_map_colocation_radius, main_map_extent, main_map_labels
+from markers import MARKER_SIZES, draw_labels, draw_points, legend_handles, point_styles
+from proximity import NEIGHBOUR_RADIUS_KM, add_proximity_columns, marker_scale
+from registry_store import PROGRAMME_COLUMNS, ROLE_COLUMNS, RegistryStore, write_registry_store, store_is_current
+from snapshots import save_snapshot
+from validation import validate_registry, print_validation_summary, write_validation_report
+
+# Plotting libraries (matplotlib, matplotlib_scalebar, folium, the tile fetcher)
+# are imported inside the functions that draw, so loading or validating data
+# does not pay for them.
 
-# Set matplotlib params for better output
-plt.rcParams['font.family'] = 'sans-serif'
-plt.rcParams['font.size'] = 10
-plt.rcParams['figure.dpi'] = 150
+def _pyplot():
+    import matplotlib.pyplot as plt
+    
+    # Set matplotlib params for better output
+    plt.rcParams['font.family'] = 'sans-serif'
+    plt.rcParams['font.size'] = 10
+    plt.rcParams['figure.dpi'] = 150
+    return plt
 
-# File path - adjust as needed
-base_data_path = r"C:\Users\CraigParker\OneDrive - Wits PHR\Desktop\Wellcome_climate_center\base.csv"
+# File path - defaults to the registry next to this script, override with --data
+base_data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "base.csv")
+
+# Local gazetteer (GeoNames dump or City;Country;lon;lat CSV) used to fill rows missing lon/lat
+gazetteer_path = os.path.join(os.path.dirname(base_data_path), "cities1000.txt")
+
+# Indexed SQLite copy of the registry for filter queries
+registry_store_path = os.path.join(os.path.dirname(base_data_path), "registry.sqlite")
+
+# Versioned Parquet snapshots of every ingested registry, used for diffs
+registry_snapshot_dir = os.path.join(os.path.dirname(base_data_path), "registry_snapshots")
 
 # Function to load and process data
-def load_data(file_path):
+def load_data(file_path, gazetteer_file=None, validation_report_path=None, store_path=None,
+              snapshot_dir=None):
+    data = read_registry(file_path, gazetteer_file, validation_report_path, store_path, snapshot_dir)
+    if data is None:
+        return None
+    return prepare_map_data(data)
+
+# Read, geocode and validate the full registry, optionally persisting it to the indexed store
+# and recording it as a new snapshot
+def read_registry(file_path, gazetteer_file=None, validation_report_path=None, store_path=None,
+                  snapshot_dir=None):
     print(f"Loading data from {file_path}")
     
     # Read CSV data
@@ -37,6 +72,32 @@ def load_data(file_path):
     # Print actual column names for debugging
     print('Actual columns in CSV:', list(data.columns))
     
+    # Fill missing coordinates from the offline gazetteer
+    data = fill_missing_coordinates(data, gazetteer_file)
+    
+    # Validate the full registry before anything is filtered or rendered
+    try:
+        world = load_world()
+    except Exception as e:
+        print(f"Skipping point-in-country checks, boundaries unavailable: {e}")
+        world = None
+    report = validate_registry(data, world)
+    print_validation_summary(report)
+    if validation_report_path is not None:
+        write_validation_report(report, validation_report_path)
+    
+    # Persist the registry for indexed queries
+    if store_path is not None:
+        write_registry_store(data, store_path, source_path=file_path)
+    
+    # Keep this version for later diffs (skipped when nothing changed)
+    if snapshot_dir is not None:
+        save_snapshot(data, snapshot_dir)
+    
+    return data
+
+# Filter to Southern Africa and derive the columns the maps are drawn from
+def prepare_map_data(data):
     # Create a mapping of expected column names to actual column names
     column_mapping = {
         'Official Partners': 'Official Partners',
@@ -100,6 +161,10 @@ def load_data(file_path):
     geometry = [Point(xy) for xy in zip(southern_africa_data['lon'], southern_africa_data['lat'])]
     southern_africa_data = gpd.GeoDataFrame(southern_africa_data, geometry=geometry, crs="EPSG:4326")
     
+    # Precompute offsets for institutions sharing the same location
+    southern_africa_data = assign_colocation_offsets(southern_africa_data)
+    
+    # Proximity columns (proximity.add_proximity_columns) are computed where they are used
     return southern_africa_data
 
 # Load natural earth data for country boundaries
@@ -107,7 +172,7 @@ def load_map_data():
     print("Loading country boundary data")
     try:
         # Load world data at 1:50m scale
-        world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+        world = load_world()
         
         # Filter for African countries
         africa = world[world['continent'] == 'Africa'].copy()
@@ -125,148 +190,95 @@ def load_map_data():
         print(f"Error loading country boundaries: {e}")
         return None, None, None
 
-# Define color palette
-color_palette = {
-    "Research": "#0F1F2C",
-    "Finance and Programmes": "#90876E",
-    "Engagement, Advocacy and Capacity Building": "#1E4611",
-    "Policy": "#CD1A1B"
-}
-
 # Create main map
-def create_main_map(data, africa, southern_africa, include_boxes=False):
+def create_main_map(data, africa, southern_africa, include_boxes=False, insets=None, aggregate_above=None,
+                    draft=None, extent=None):
     print("Creating main map")
+    draft = preview.is_draft(draft)
+    
+    # Visible area [xmin, xmax, ymin, ymax]; labels and annotations outside it are not drawn
+    xmin, xmax, ymin, ymax = main_map_extent if extent is None else extent
+    
+    def in_view(x, y):
+        return (xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax)
+    
+    plt = _pyplot()
+    import matplotlib.patches as mpatches
+    import matplotlib.lines as mlines
+    from matplotlib.patches import Rectangle
+    from matplotlib.patheffects import withStroke
+    from matplotlib_scalebar.scalebar import ScaleBar
     
     fig, ax = plt.subplots(figsize=(10, 8))
     
+    # Drafts draw coarser country outlines
+    if draft:
+        africa, southern_africa = preview.simplified(africa), preview.simplified(southern_africa)
+    
     # Plot Africa background
-    africa.plot(ax=ax, color='white', edgecolor='gray', linewidth=0.3, alpha=0.9)
+    if draft:
+        preview.draw_boundaries(ax, africa, facecolor='white', edgecolor='gray', linewidth=0.3, alpha=0.9)
+    else:
+        africa.plot(ax=ax, color='white', edgecolor='gray', linewidth=0.3, alpha=0.9)
     
     # Plot southern Africa with slightly darker borders
-    if southern_africa is not None:
+    if southern_africa is not None and draft:
+        preview.draw_boundaries(ax, southern_africa, facecolor='white', edgecolor='darkgray', linewidth=0.5,
+                                alpha=0.9)
+    elif southern_africa is not None:
         southern_africa.plot(ax=ax, color='white', edgecolor='darkgray', linewidth=0.5, alpha=0.9)
     
-    # Plot points with focus area colors
-    for focus_type, color in color_palette.items():
-        # Filter by focus type
-        focus_data = data[data['FocusType'] == focus_type]
-        
-        # Plot points by shape
-        circle_data = focus_data[focus_data['Shape'] == 'circle']
-        triangle_data = focus_data[focus_data['Shape'] == 'triangle']
-        
-        # Plot circles
-        if len(circle_data) > 0:
-            ax.scatter(circle_data.geometry.x, circle_data.geometry.y, 
-                      c=color, marker='o', s=50, label=f"{focus_type} (Regular)",
-                      edgecolor='black', linewidth=0.5, alpha=0.9)
+    # Spread co-located institutions apart (the map spans 30 degrees of longitude)
+    colocation_radius = main_map_colocation_radius
+    plot_x, plot_y = displaced_xy(data, colocation_radius)
+    data = data.assign(plot_x=plot_x, plot_y=plot_y)
+    
+    # Very large point sets are drawn as one density image instead of a marker per row
+    aggregated = should_aggregate(len(data), aggregate_above)
+    if aggregated:
+        draw_density(ax, data['plot_x'], data['plot_y'], data['FocusType'], color_palette, [xmin, xmax, ymin, ymax])
+    else:
+        draw_spider_legs(ax, data, colocation_radius)
         
-        # Plot triangles
-        if len(triangle_data) > 0:
-            ax.scatter(triangle_data.geometry.x, triangle_data.geometry.y, 
-                      c=color, marker='^', s=60, label=f"{focus_type} (Data Provider)",
-                      edgecolor='black', linewidth=0.5, alpha=0.9)
+        # Every marker in one pass: colour from FocusType, shape from Data_Providers, major partners on top
+        draw_points(ax, data['plot_x'], data['plot_y'],
+                    point_styles(data, color_palette, MARKER_SIZES['main'], size_scale=marker_scale(data)))
     
     # Add labels for major partners with overlap avoidance
-    used_positions = {}  # Keep track of label positions
-    
-    # Sort by latitude to prioritize placement
-    labeled_data = data[data['is_major_partner']].sort_values('lat')
+    labeled_data = main_map_labels(data, aggregated)
+    labeled_data = labeled_data[in_view(labeled_data['plot_x'], labeled_data['plot_y']) &
+                                in_view(labeled_data['label_x'], labeled_data['label_y'])]
     
-    for idx, row in labeled_data.iterrows():
-        x, y = row.geometry.x, row.geometry.y
-        full_name = row['Institution']  # Use full institution name
-        
-        # Initialize label position
-        label_x = x + 0.05
-        label_y = y + 0.05
-        
-        # Check for overlaps and adjust position
-        overlap = True
-        offsets = [(0.05, 0.05), (-0.05, 0.05), (0.05, -0.05), (-0.05, -0.05),
-                  (0.1, 0), (-0.1, 0), (0, 0.1), (0, -0.1)]
-        
-        for dx, dy in offsets:
-            test_x = x + dx
-            test_y = y + dy
-            
-            # Check if this position is far enough from other labels
-            position_ok = True
-            for used_x, used_y in used_positions.values():
-                if abs(test_x - used_x) < 0.2 and abs(test_y - used_y) < 0.1:
-                    position_ok = False
-                    break
-            
-            if position_ok:
-                label_x = test_x
-                label_y = test_y
-                overlap = False
-                break
-        
-        # Store the used position
-        used_positions[full_name] = (label_x, label_y)
-        
-        # Add label with background box
-        bbox_props = dict(
-            boxstyle="round,pad=0.3",
-            fc="white",
-            ec="gray",
-            alpha=0.9,
-            mutation_scale=0.5
-        )
-        
-        # Create arrow connection
-        ax.annotate(
-            full_name,
-            xy=(x, y),  # Institution point
-            xytext=(label_x, label_y),  # Label position
-            bbox=bbox_props,
-            fontsize=8,
-            fontweight='bold',
-            arrowprops=dict(
-                arrowstyle="->",
-                connectionstyle="arc3,rad=0.2",
-                color='gray',
-                alpha=0.6
-            )
-        )
+    # Boxed labels with leader lines; drafts show the label text alone. Over a density image
+    # they go on top of it
+    draw_labels(ax, labeled_data, fontsize=8, boxed=not draft, fontweight='bold',
+                zorder=density.DENSITY_ZORDER + 1 if aggregated else None)
     
     # Add inset boxes if requested
     if include_boxes:
-        # Johannesburg/Tshwane area
-        jhb_tshwane_bbox = [27.5, 28.7, -26.5, -25.4]  # Wider zoom for less clutter
-        jhb_rect = Rectangle((jhb_tshwane_bbox[0], jhb_tshwane_bbox[2]), 
-                            jhb_tshwane_bbox[1]-jhb_tshwane_bbox[0], 
-                            jhb_tshwane_bbox[3]-jhb_tshwane_bbox[2],
-                            linewidth=1, edgecolor='#0F1F2C', facecolor='none')
-        ax.add_patch(jhb_rect)
-        ax.annotate('Johannesburg/\nTshwane', 
-                   (jhb_tshwane_bbox[0]-0.5, jhb_tshwane_bbox[2]-0.2),
-                   fontsize=10, fontweight='bold', color='#0F1F2C')
-        
-        # Cape Town area
-        cape_town_bbox = [18.3, 18.7, -34.2, -33.7]  # xmin, xmax, ymin, ymax
-        cape_rect = Rectangle((cape_town_bbox[0], cape_town_bbox[2]), 
-                             cape_town_bbox[1]-cape_town_bbox[0], 
-                             cape_town_bbox[3]-cape_town_bbox[2],
-                             linewidth=1, edgecolor='#CD1A1B', facecolor='none')
-        ax.add_patch(cape_rect)
-        ax.annotate('Cape Town', 
-                   (cape_town_bbox[0]-0.5, cape_town_bbox[2]-0.2),
-                   fontsize=10, fontweight='bold', color='#CD1A1B')
-    
-    # Set map boundaries for Southern Africa
-    ax.set_xlim(10, 40)
-    ax.set_ylim(-35, 0)
+        for inset in insets or []:
+            box_xmin, box_xmax, box_ymin, box_ymax = inset['bbox']
+            rect = Rectangle((box_xmin, box_ymin), box_xmax - box_xmin, box_ymax - box_ymin,
+                             linewidth=1, edgecolor=inset['color'], facecolor='none')
+            ax.add_patch(rect)
+            if in_view(box_xmin - 0.5, box_ymin - 0.2):
+                ax.annotate(inset['name'].replace(' & ', '/\n'), 
+                           (box_xmin - 0.5, box_ymin - 0.2),
+                           fontsize=10, fontweight='bold', color=inset['color'])
+    
+    # Set map boundaries (Southern Africa unless another extent was given)
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
     
     # Add scale bar
     ax.add_artist(ScaleBar(1.0, dimension='si-length', units='km', 
                          location='lower left', pad=0.5, 
                          frameon=True, color='black', box_alpha=0.5))
     
-    # Add North arrow - simple approach
-    arrow_x, arrow_y = 38, -2
-    arrow_length = 1
+    # Add North arrow - simple approach (at 38E 2S on the default extent)
+    arrow_x = xmax - (xmax - xmin) / 15
+    arrow_y = ymax - (ymax - ymin) / 17.5
+    arrow_length = (ymax - ymin) / 35
     ax.annotate('N', xy=(arrow_x, arrow_y), xytext=(arrow_x, arrow_y-arrow_length),
                arrowprops=dict(facecolor='black', width=1, headwidth=5),
                ha='center', va='center', fontsize=10, fontweight='bold')
@@ -278,21 +290,14 @@ def create_main_map(data, africa, southern_africa, include_boxes=False):
     ax.text(0.5, -0.05, "Source: Wellcome Climate Center", 
            transform=ax.transAxes, ha='center', fontsize=9)
     
-    # Create custom legend
-    handles = []
-    
-    # Focus Area colors
-    for focus_type, color in color_palette.items():
-        handles.append(mpatches.Patch(color=color, label=focus_type))
-    
-    # Add spacing in legend
-    handles.append(plt.Line2D([0], [0], color='none', label=' '))  # Empty row for spacing
-    
-    # Shape types
-    handles.append(mlines.Line2D([], [], color='gray', marker='o', linestyle='None',
-                                markersize=6, label='Regular Institution'))
-    handles.append(mlines.Line2D([], [], color='gray', marker='^', linestyle='None',
-                                markersize=6, label='Data Provider'))
+    # Create custom legend from the marker style tables: focus area colours, then the shape types,
+    # or the density scale when points are aggregated
+    handles = legend_handles(color_palette, shapes=not aggregated)
+    if aggregated:
+        handles.append(mpatches.Patch(color='gray', alpha=0.6, label=f"Institutions per cell, log scale ({len(data)})"))
+    else:
+        handles.append(mlines.Line2D([], [], color='none',
+                                    label=f'Larger markers: more partners within {NEIGHBOUR_RADIUS_KM} km'))
     
     # Make the legend more visible with a better background
     legend = plt.legend(handles=handles, 
@@ -323,17 +328,17 @@ def create_main_map(data, africa, southern_africa, include_boxes=False):
     }
 
     for country, (lon, lat) in countries.items():
+        if not in_view(lon, lat):
+            continue
         ax.text(lon, lat, country, fontsize=8, ha='center', 
                path_effects=[withStroke(foreground='white', linewidth=3)],
                zorder=90)
     
     return fig, ax
 
-# Create detailed inset map with contextily basemap
-def create_inset_map(data, bbox, title, simplified=False):
-    print(f"Creating inset map for {title}")
-    
-    # Extract coordinates
+# Institutions an inset map shows and the box they were taken from ([xmin, xmax, ymin, ymax],
+# grown by 0.1 degrees when the given box holds none)
+def inset_area_data(data, bbox, title):
     xmin, xmax, ymin, ymax = bbox
     
     # Filter data to show only major institutions or use another criterion
@@ -352,22 +357,41 @@ def create_inset_map(data, bbox, title, simplified=False):
     area_data = filtered_data[(filtered_data.geometry.x >= xmin) & (filtered_data.geometry.x <= xmax) & 
                              (filtered_data.geometry.y >= ymin) & (filtered_data.geometry.y <= ymax)].copy()
     
-    print(f"Found {len(area_data)} points in the {title} area")
-    
-    # Check if we have any points in this area
+    # Expand the bbox slightly in case points are just outside
     if len(area_data) == 0:
-        print(f"WARNING: No data points found in the {title} area!")
-        print(f"Bounding box: {bbox}")
-        print("Check if your bounding box coordinates are correct.")
-        # Expand the bbox slightly in case points are just outside
         xmin -= 0.1
         xmax += 0.1
         ymin -= 0.1
         ymax += 0.1
-        print(f"Trying expanded bounding box: [{xmin}, {xmax}, {ymin}, {ymax}]")
         area_data = filtered_data[(filtered_data.geometry.x >= xmin) & (filtered_data.geometry.x <= xmax) & 
                                  (filtered_data.geometry.y >= ymin) & (filtered_data.geometry.y <= ymax)].copy()
+    
+    return area_data, [xmin, xmax, ymin, ymax]
+
+# Create detailed inset map with a tile basemap
+def create_inset_map(data, bbox, title, simplified=False, tile_providers=None, aggregate_above=None,
+                     draft=None):
+    print(f"Creating inset map for {title}")
+    draft = preview.is_draft(draft)
+    
+    plt = _pyplot()
+    import matplotlib.patches as mpatches
+    import matplotlib.lines as mlines
+    from matplotlib_scalebar.scalebar import ScaleBar
+    from tiles import fetch_tiles, zoom_for_extent
+    
+    # Institutions shown in this area, and the (possibly expanded) box they were taken from
+    area_data, (xmin, xmax, ymin, ymax) = inset_area_data(data, bbox, title)
+    
+    # Check if we have any points in this area
+    if list(bbox) != [xmin, xmax, ymin, ymax]:
+        print(f"WARNING: No data points found in the {title} area!")
+        print(f"Bounding box: {bbox}")
+        print("Check if your bounding box coordinates are correct.")
+        print(f"Trying expanded bounding box: [{xmin}, {xmax}, {ymin}, {ymax}]")
         print(f"Found {len(area_data)} points with expanded box")
+    else:
+        print(f"Found {len(area_data)} points in the {title} area")
     
     # Calculate buffer to add around points to ensure they're all visible
     buffer = 0.02
@@ -377,130 +401,48 @@ def create_inset_map(data, bbox, title, simplified=False):
     
     # Add country boundaries to inset maps for context
     try:
-        world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
-        country_boundaries = world.to_crs(area_data.crs)
-        country_boundaries.plot(ax=ax, color='white', edgecolor='gray', linewidth=0.5, alpha=0.5, zorder=1)
+        if draft:
+            preview.draw_boundaries(ax, preview.simplified(load_world()).to_crs(area_data.crs),
+                                    facecolor='white', edgecolor='gray', linewidth=0.5, alpha=0.5, zorder=1)
+        else:
+            country_boundaries = load_world().to_crs(area_data.crs)
+            country_boundaries.plot(ax=ax, color='white', edgecolor='gray', linewidth=0.5, alpha=0.5, zorder=1)
         print(f"Added country boundaries to {title} map")
     except Exception as e:
         print(f"Could not add country boundaries: {e}")
     
-    # Plot points with focus area colors
-    for focus_type, color in color_palette.items():
-        # Filter by focus type
-        focus_data = area_data[area_data['FocusType'] == focus_type]
-        
-        if len(focus_data) > 0:
-            print(f"Found {len(focus_data)} points with focus type '{focus_type}' in {title}")
-        
-        # Plot points by shape
-        circle_data = focus_data[focus_data['Shape'] == 'circle']
-        triangle_data = focus_data[focus_data['Shape'] == 'triangle']
-        
-        # Plot circles
-        if len(circle_data) > 0:
-            ax.scatter(circle_data.geometry.x, circle_data.geometry.y, 
-                      c=color, marker='o', s=80, label=f"{focus_type} (Regular)",
-                      edgecolor='black', linewidth=0.5, alpha=0.9, zorder=10)
-        
-        # Plot triangles
-        if len(triangle_data) > 0:
-            ax.scatter(triangle_data.geometry.x, triangle_data.geometry.y, 
-                      c=color, marker='^', s=100, label=f"{focus_type} (Data Provider)",
-                      edgecolor='black', linewidth=0.5, alpha=0.9, zorder=10)
-    
-    # Enhanced label positioning algorithm with improved anti-overlap
-    used_positions = {}  # Keep track of label positions
-    
-    # Sort institutions by importance to prioritize positioning (e.g., major partners first)
-    # You can also sort alphabetically if preferred
-    for idx, row in area_data.sort_values(by=['lat']).iterrows():
-        x, y = row.geometry.x, row.geometry.y
-        full_name = row['Institution']  # Use full institution name
-        
-        # Calculate text size for better positioning
-        text_width = len(full_name) * 0.002  # Approximate width based on text length
-        
-        # Create a much wider range of possible offsets with greater distances
-        # Start with positions further away from points to reduce clutter
-        offsets = []
-        
-        # Generate more varied offsets (further from points)
-        for dist in [0.02, 0.03, 0.04, 0.05]:
-            # 8 directions around the point
-            for angle in [0, 45, 90, 135, 180, 225, 270, 315]:
-                rad = np.radians(angle)
-                dx = dist * np.cos(rad)
-                dy = dist * np.sin(rad)
-                offsets.append((dx, dy))
-        
-        # Check for overlaps with much larger minimum distances
-        overlap = True
-        label_x, label_y = x, y  # Default position
-        
-        for dx, dy in offsets:
-            test_x = x + dx
-            test_y = y + dy
-            
-            # Increase minimum spacing between labels
-            position_ok = True
-            for used_x, used_y in used_positions.values():
-                # Increase these values to enforce more space between labels
-                if abs(test_x - used_x) < 0.3 and abs(test_y - used_y) < 0.2:
-                    position_ok = False
-                    break
-            
-            if position_ok:
-                label_x = test_x
-                label_y = test_y
-                overlap = False
-                break
-        
-        # Store the used position
-        used_positions[full_name] = (label_x, label_y)
+    # Spread co-located institutions apart, scaled to the inset extent
+    colocation_radius = 0.012 * (xmax - xmin)
+    plot_x, plot_y = displaced_xy(area_data, colocation_radius)
+    area_data['plot_x'] = plot_x
+    area_data['plot_y'] = plot_y
+    
+    # Very large point sets are drawn as one density image once the extent is known; the
+    # simplified overlay draws every institution, not just those in the area
+    drawn_data = data if simplified else area_data
+    aggregated = should_aggregate(len(drawn_data), aggregate_above)
+    if not aggregated:
+        draw_spider_legs(ax, area_data, colocation_radius)
         
-        # Create arrow connection with different styles
-        conn_style = "arc3,rad=0.2" if idx % 2 == 0 else "arc3,rad=-0.2"
-        
-        # Add label with better formatting
-        ax.annotate(
-            full_name,
-            xy=(x, y),  # Point
-            xytext=(label_x, label_y),  # Label position
-            bbox=dict(
-                boxstyle="round,pad=0.3",
-                fc="white",
-                ec="gray",
-                alpha=0.9,
-                mutation_scale=0.5
-            ),
-            fontsize=7,  # Smaller font
-            fontweight='normal',  # Less emphasis 
-            arrowprops=dict(
-                arrowstyle="->",
-                connectionstyle=conn_style,
-                color='gray',
-                alpha=0.6,
-                linewidth=0.8  # Thinner arrow
-            ),
-            zorder=11,
-            ha='center'  # Center alignment can help with layout
-        )
-    
-    # Create custom legend
-    handles = []
-    
-    # Focus Area colors
-    for focus_type, color in color_palette.items():
-        handles.append(mpatches.Patch(color=color, label=focus_type))
-    
-    # Add spacing in legend
-    handles.append(plt.Line2D([0], [0], color='none', label=''))
-    
-    # Shape types
-    handles.append(mlines.Line2D([], [], color='gray', marker='o', linestyle='None',
-                                markersize=6, label='Regular Institution'))
-    handles.append(mlines.Line2D([], [], color='gray', marker='^', linestyle='None',
-                                markersize=6, label='Data Provider'))
+        # Every marker in one pass: colour from FocusType, shape from Data_Providers, major partners on top
+        draw_points(ax, area_data['plot_x'], area_data['plot_y'],
+                    point_styles(area_data, color_palette, MARKER_SIZES['inset'], zorder=10,
+                                 size_scale=marker_scale(area_data, among=data)))
+        for focus_type, count in area_data['FocusType'].value_counts(sort=False).items():
+            print(f"Found {count} points with focus type '{focus_type}' in {title}")
+    
+    # Label institutions clear of each other, with boxed callouts (plain text in drafts)
+    labeled_data = inset_map_labels(area_data, aggregated)
+    draw_labels(ax, labeled_data, fontsize=7, boxed=not draft, zorder=density.DENSITY_ZORDER + 1, ha='center')
+    
+    # Create custom legend from the marker style tables: focus area colours, then the shape types,
+    # or the density scale when points are aggregated
+    handles = legend_handles(color_palette, shapes=not aggregated)
+    if aggregated:
+        handles.append(mpatches.Patch(color='gray', alpha=0.6, label=f"Institutions per cell, log scale ({len(drawn_data)})"))
+    else:
+        handles.append(mlines.Line2D([], [], color='none',
+                                    label=f'Larger markers: more partners within {NEIGHBOUR_RADIUS_KM} km'))
     
     # Add legend with two columns
     plt.legend(handles=handles, loc='upper left', ncol=1, frameon=True, 
@@ -526,61 +468,26 @@ def create_inset_map(data, bbox, title, simplified=False):
     
     print(f"Set {title} map boundaries to: x=[{ax.get_xlim()[0]}, {ax.get_xlim()[1]}], y=[{ax.get_ylim()[0]}, {ax.get_ylim()[1]}]")
     
-    # Try to add contextily basemap with simplified approach
+    if aggregated:
+        drawn_x, drawn_y = displaced_xy(drawn_data, colocation_radius)
+        draw_density(ax, drawn_x, drawn_y, drawn_data['FocusType'], color_palette, ax.get_xlim() + ax.get_ylim())
+    
+    # Add a tile basemap covering the visible extent, fetched tile by tile in parallel, at the
+    # zoom the exported map width needs (drafts need few tiles and skip retries)
     try:
-        # Use a known-good provider and explicit approach
-        print(f"Adding basemap for {title} using simplified approach")
-        
-        # First convert to web mercator
-        area_mercator = area_data.to_crs(epsg=3857)
-        
-        # Create a new axis for the web mercator projection
-        fig_mercator = plt.figure(figsize=(10, 9))  # Larger size for better quality
-        ax_mercator = fig_mercator.add_subplot(111)
-        
-        # Plot the data on the mercator axis (make points transparent)
-        area_mercator.plot(ax=ax_mercator, alpha=0, color='none')
-        
-        # Set the limits based on data with a larger buffer
-        x_range = area_mercator.geometry.x.max() - area_mercator.geometry.x.min()
-        y_range = area_mercator.geometry.y.max() - area_mercator.geometry.y.min()
-        buffer_x = 0.25 * x_range  # Increased buffer for more context
-        buffer_y = 0.25 * y_range  # Increased buffer for more context
+        print(f"Adding basemap for {title}")
         
-        ax_mercator.set_xlim(area_mercator.geometry.x.min() - buffer_x, 
-                            area_mercator.geometry.x.max() + buffer_x)
-        ax_mercator.set_ylim(area_mercator.geometry.y.min() - buffer_y, 
-                            area_mercator.geometry.y.max() + buffer_y)
-        
-        # Try different basemap providers for better clarity
-        try:
-            # First try Stamen Terrain which is often clearer for context
-            cx.add_basemap(ax_mercator, source=cx.providers.Stamen.Terrain, zoom=13)
-        except Exception:
-            try:
-                # Fall back to CartoDB which is a good alternative
-                cx.add_basemap(ax_mercator, source=cx.providers.CartoDB.Positron, zoom=13)
-            except Exception:
-                # Last resort
-                cx.add_basemap(ax_mercator, source=cx.providers.OpenStreetMap.Mapnik, zoom=13)
-        
-        # Save with higher DPI
-        temp_map_file = f"python_maps/temp_{title.replace(' ', '_')}.png"
-        plt.savefig(temp_map_file, dpi=200, bbox_inches='tight')
-        plt.close(fig_mercator)
-        
-        # Now read the map as an image and display in our original axes
-        from matplotlib.image import imread
-        basemap_img = imread(temp_map_file)
+        (west, east), (south, north) = ax.get_xlim(), ax.get_ylim()
+        width_px = ax.get_position().width * fig.get_figwidth() * (preview.DRAFT_DPI if draft else export.EXPORT_DPI)
+        basemap_img, basemap_extent = fetch_tiles(west, south, east, north,
+                                                  zoom=zoom_for_extent(west, south, east, north, width_px),
+                                                  providers=tile_providers, retries=0 if draft else 2)
         
         # Display the basemap image in our original axes
-        ax.imshow(basemap_img, extent=ax.get_xlim() + ax.get_ylim(), 
-                 alpha=0.8, zorder=0)
+        ax.imshow(basemap_img, extent=basemap_extent, alpha=0.8, zorder=0)
+        ax.set_xlim(west, east)
+        ax.set_ylim(south, north)
         
-        # Remove the temporary file
-        if os.path.exists(temp_map_file):
-            os.remove(temp_map_file)
-            
         print(f"Successfully added basemap for {title}")
         
     except Exception as e:
@@ -614,37 +521,43 @@ def create_inset_map(data, bbox, title, simplified=False):
     # Ensure aspect ratio is reasonable
     ax.set_aspect('equal', adjustable='box')
     
-    if simplified and title.lower() == "johannesburg & tshwane":
-        # Create a colorblind-friendly colormap
-        colors = plt.cm.tab10(range(len(data['FocusType'].unique())))
-        
-        # Plot points with legend but use varying sizes based on importance
-        for i, category in enumerate(data['FocusType'].unique()):
-            subset = data[data['FocusType'] == category]
+    if simplified:
+        # Every institution in the region, one colour per focus type, with counts in the legend
+        categories = data['FocusType'].unique()
+        counts = data['FocusType'].value_counts()
+        if aggregated:
+            # The density layer already shows every institution in the focus-area colours
+            overlay_palette = {category: color_palette[category] for category in categories}
+        else:
+            # Create a colorblind-friendly colormap
+            overlay_palette = dict(zip(categories, plt.cm.tab10(range(len(categories)))))
             
-            # If the data has official partners or other importance metrics
-            if 'Official Partners' in subset.columns:
-                sizes = subset['Official Partners'].apply(lambda x: 100 if x==1 else 60)
+            # Use varying sizes based on importance, if the data has official partners
+            if 'Official Partners' in data.columns:
+                sizes = np.where(data['Official Partners'] == 1, 100, 60)
             else:
                 sizes = 80  # Default size
             
-            ax.scatter(
-                subset.geometry.x, subset.geometry.y,
-                s=sizes, alpha=0.8, 
-                color=colors[i],
-                label=f"{category} ({len(subset)} institutions)"
-            )
+            overlay_x, overlay_y = displaced_xy(data, colocation_radius)
+            ax.scatter(overlay_x, overlay_y, s=sizes, alpha=0.8,
+                       color=[overlay_palette[category] for category in data['FocusType']])
         
         # Add a more prominently positioned legend
-        legend = ax.legend(loc='upper right', fontsize=8, framealpha=0.9)
+        legend = ax.legend(handles=[mpatches.Patch(color=overlay_palette[category],
+                                                   label=f"{category} ({counts[category]} institutions)")
+                                    for category in categories],
+                           loc='upper right', fontsize=8, framealpha=0.9)
         legend.set_zorder(100)  # Ensure legend is on top
     
     return fig, ax
 
 # Create combined layout
-def create_combined_layout(main_fig, jhb_fig, cape_fig):
+def create_combined_layout(main_fig, inset_figs):
     print("Creating combined layout")
     
+    plt = _pyplot()
+    import matplotlib.patches as mpatches
+    
     # Function to copy artists from source to target axis
     def copy_artists(ax_source, ax_target):
         for artist in ax_source.get_children():
@@ -665,32 +578,32 @@ def create_combined_layout(main_fig, jhb_fig, cape_fig):
     # Copy main map content
     copy_artists(main_fig.axes[0], ax_main)
     
-    # Create Johannesburg inset
-    ax_jhb = fig.add_axes([0.82, 0.5, 0.15, 0.35])
-    copy_artists(jhb_fig.axes[0], ax_jhb)
-    
-    # Create Cape Town inset
-    ax_cape = fig.add_axes([0.82, 0.1, 0.15, 0.35])
-    copy_artists(cape_fig.axes[0], ax_cape)
+    # Stack the insets down the right-hand side, densest first
+    slot = 0.8 / max(len(inset_figs), 1)
+    for i, inset_fig in enumerate(inset_figs):
+        ax_inset = fig.add_axes([0.82, 0.1 + (len(inset_figs) - 1 - i) * slot, 0.15, slot - 0.05])
+        copy_artists(inset_fig.axes[0], ax_inset)
     
     return fig
 
 # Create dashboard style layout
-def create_dashboard(main_fig, jhb_fig, cape_fig):
+def create_dashboard(main_fig, inset_figs, inset_names):
     print("Creating dashboard layout")
     
+    plt = _pyplot()
+    import matplotlib.collections
+    
     # Create a new figure
     fig = plt.figure(figsize=(15, 18))
     
-    # Create a GridSpec with 2 rows and 2 columns
-    gs = fig.add_gridspec(2, 2, height_ratios=[1.2, 1])
+    # Create a GridSpec with 2 rows and one column per inset
+    gs = fig.add_gridspec(2, max(len(inset_figs), 1), height_ratios=[1.2, 1])
     
-    # Create the main map in the top row (spanning both columns)
+    # Create the main map in the top row (spanning all columns)
     ax_main = fig.add_subplot(gs[0, :])
     
-    # Create the two inset maps in the bottom row
-    bottom_left = fig.add_subplot(gs[1, 0])
-    bottom_right = fig.add_subplot(gs[1, 1])
+    # Create the inset maps in the bottom row
+    bottom_axes = [fig.add_subplot(gs[1, i]) for i in range(len(inset_figs))]
     
     # Function to recreate plots instead of copying
     def recreate_plot(ax_target, source_fig, title=None):
@@ -724,18 +637,17 @@ def create_dashboard(main_fig, jhb_fig, cape_fig):
         # Turn off axes
         ax_target.axis('off')
     
-    # Recreate the three maps in their appropriate positions
+    # Recreate the maps in their appropriate positions
     recreate_plot(ax_main, main_fig, "Southern Africa Climate & Health Initiatives")
-    recreate_plot(bottom_left, jhb_fig, "Johannesburg & Tshwane Focus")
-    recreate_plot(bottom_right, cape_fig, "Cape Town Focus")
+    for ax_inset, inset_fig, name in zip(bottom_axes, inset_figs, inset_names):
+        recreate_plot(ax_inset, inset_fig, f"{name} Focus")
     
     # Add panel labels
     ax_main.text(-0.05, 1.0, 'A', transform=ax_main.transAxes, 
                 fontsize=20, fontweight='bold', va='top')
-    bottom_left.text(-0.1, 1.0, 'B', transform=bottom_left.transAxes, 
-                    fontsize=20, fontweight='bold', va='top')
-    bottom_right.text(-0.1, 1.0, 'C', transform=bottom_right.transAxes, 
-                     fontsize=20, fontweight='bold', va='top')
+    for i, ax_inset in enumerate(bottom_axes):
+        ax_inset.text(-0.1, 1.0, chr(ord('B') + i), transform=ax_inset.transAxes, 
+                      fontsize=20, fontweight='bold', va='top')
     
     # Add overall title
     fig.suptitle("Climate & Health Initiatives in Southern Africa", 
@@ -756,7 +668,8 @@ def add_static_basemap(ax, area_name):
     """Add a static background map as a last resort."""
     # Use a simple world map as background
     try:
-        world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+        (west, east), (south, north) = ax.get_xlim(), ax.get_ylim()
+        world = load_world()
         world = world.to_crs(epsg=4326)
         
         # Plot with appropriate styling
@@ -773,8 +686,11 @@ def add_static_basemap(ax, area_name):
             "Harare": (31.0522, -17.8312)
         }
         
-        # Plot city markers for context
+        # Plot city markers for context, only those in view (labels outside the axes are not
+        # clipped and would stretch the tight bounding box of the saved figure)
         for city, (lon, lat) in cities.items():
+            if not (west <= lon <= east and south <= lat <= north):
+                continue
             ax.plot(lon, lat, 'o', color='darkblue', markersize=5, alpha=0.7, zorder=5)
             ax.text(lon, lat, f" {city}", fontsize=8, ha='left', va='center', alpha=0.7, zorder=5)
         
@@ -784,62 +700,412 @@ def add_static_basemap(ax, area_name):
         print(f"Failed to add static world map: {e}")
         return False
 
-# Main function to run the workflow
-def main():
-    print("Starting map generation workflow")
-    
+# Create interactive web map
+def create_web_map(data, insets=None):
+    print("Creating web map")
+    
+    import folium
+    
+    web_map = folium.Map(location=[-22, 25], zoom_start=5, tiles='CartoDB positron')
+    
+    # One circle marker per institution, data providers outlined in black
+    for _, row in data.dropna(subset=['lon', 'lat']).iterrows():
+        color = color_palette[row['FocusType']]
+        folium.CircleMarker(
+            location=[row['lat'], row['lon']],
+            radius=7 if row['is_major_partner'] else 5,
+            color='black' if row['Shape'] == 'triangle' else color,
+            weight=2 if row['Shape'] == 'triangle' else 1,
+            fill=True,
+            fill_color=color,
+            fill_opacity=0.9,
+            tooltip=row['Institution'],
+            popup=f"{row['Institution']}<br>{row['City']}, {row['Country']}<br>{row['FocusType']}",
+        ).add_to(web_map)
+    
+    # Outline the inset areas
+    for inset in insets or []:
+        xmin, xmax, ymin, ymax = inset['bbox']
+        folium.Rectangle(bounds=[[ymin, xmin], [ymax, xmax]], color=inset['color'],
+                         fill=False, weight=1, tooltip=inset['name']).add_to(web_map)
+    
+    return web_map
+
+# Save a figure in each requested format, plus a PNG thumbnail, from a single render;
+# in draft mode only a low-resolution <name>_draft.png is written
+def save_figure(fig, output_dir, name, formats=('pdf',)):
+    if preview.draft:
+        result = export.export_draft(fig, output_dir, preview.draft_name(name), preview.DRAFT_DPI)
+        preview.drafted.append(name)
+    else:
+        result = export.export_figure(fig, output_dir, name, formats)
+    for file in result['files']:
+        print(f"Saved {file['path']}")
+    return result
+
+# Build the main maps as {output name: figure}
+def build_main_maps(data, africa, southern_africa, insets, names=None):
+    figures = {}
+    if names is None or 'southern_africa_map' in names:
+        figures['southern_africa_map'], _ = create_main_map(data, africa, southern_africa, include_boxes=False)
+    if names is None or 'southern_africa_map_with_boxes' in names:
+        figures['southern_africa_map_with_boxes'], _ = create_main_map(data, africa, southern_africa,
+                                                                      include_boxes=True, insets=insets)
+    return figures
+
+# Build the inset maps as {output name: figure}, with the simplified overlay on the densest one
+def build_inset_maps(data, insets, names=None):
+    figures = {}
+    for i, inset in enumerate(insets):
+        name = f"{inset['slug']}_map"
+        if names is None or name in names or inset['slug'] in names:
+            figures[name], _ = create_inset_map(data, inset['bbox'], inset['name'], simplified=(i == 0))
+    return figures
+
+# Load everything the map outputs need
+def prepare_inputs(data_path, output_dir, gazetteer_file=None, report=True, snapshot_dir=None):
     # Create output directory if it doesn't exist
-    os.makedirs("python_maps", exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
     
     # Load data
-    data = load_data(base_data_path)
+    report_path = os.path.join(output_dir, "validation_report.json") if report else None
+    data = load_data(data_path, gazetteer_file, report_path, snapshot_dir=snapshot_dir)
     if data is None:
         print("Failed to load data. Exiting.")
-        return
+        return None
     
     # Load map boundary data
     world, africa, southern_africa = load_map_data()
     if africa is None:
         print("Failed to load boundary data. Exiting.")
-        return
+        return None
     
-    # Define bounding boxes - adjust these if needed
-    jhb_tshwane_bbox = [27.5, 28.7, -26.5, -25.4]  # Wider zoom for less clutter
-    cape_town_bbox = [18.3, 18.7, -34.2, -33.7]  # xmin, xmax, ymin, ymax
+    # Find the densest clusters to show as insets
+    insets = discover_insets(data)
+    return data, africa, southern_africa, insets
 
-    # If these don't work, try expanding them:
-    # jhb_tshwane_bbox = [27.5, 28.5, -26.5, -25.4]
-    # cape_town_bbox = [18.0, 19.0, -34.5, -33.5]
-    
-    # Create main map
-    main_fig, _ = create_main_map(data, africa, southern_africa, include_boxes=False)
-    main_fig_boxes, _ = create_main_map(data, africa, southern_africa, include_boxes=True)
-    
-    # Save main maps with PDF format
-    main_fig.savefig("python_maps/southern_africa_map.pdf", dpi=300, bbox_inches='tight')
-    main_fig_boxes.savefig("python_maps/southern_africa_map_with_boxes.pdf", dpi=300, bbox_inches='tight')
+# Main function to run the workflow; returns the exit status
+def main(data_path=None, output_dir="python_maps", gazetteer_file=None, snapshot_dir=None):
+    print("Starting map generation workflow")
     
-    # Create inset maps
-    jhb_fig, _ = create_inset_map(data, jhb_tshwane_bbox, "Johannesburg & Tshwane", simplified=True)
-    cape_fig, _ = create_inset_map(data, cape_town_bbox, "Cape Town")
+    inputs = prepare_inputs(data_path or base_data_path, output_dir, gazetteer_file or gazetteer_path,
+                            snapshot_dir=snapshot_dir or registry_snapshot_dir)
+    if inputs is None:
+        return 1
+    data, africa, southern_africa, insets = inputs
     
-    # Save inset maps with PDF format
-    jhb_fig.savefig("python_maps/johannesburg_tshwane_map.pdf", dpi=300, bbox_inches='tight')
-    cape_fig.savefig("python_maps/cape_town_map.pdf", dpi=300, bbox_inches='tight')
+    # Create and save main maps with PDF format
+    exports = []
+    main_figs = build_main_maps(data, africa, southern_africa, insets)
+    for name, fig in main_figs.items():
+        exports.append(save_figure(fig, output_dir, name))
     
-    # Also save PNG versions for compatibility
-    jhb_fig.savefig("python_maps/johannesburg_tshwane_map.png", dpi=300, bbox_inches='tight')
-    cape_fig.savefig("python_maps/cape_town_map.png", dpi=300, bbox_inches='tight')
+    # Create and save inset maps with PDF format, and PNG versions for compatibility
+    inset_figs = build_inset_maps(data, insets)
+    for name, fig in inset_figs.items():
+        exports.append(save_figure(fig, output_dir, name, formats=('pdf', 'png')))
     
     # Create combined layout
-    combined_fig = create_combined_layout(main_fig_boxes, jhb_fig, cape_fig)
-    combined_fig.savefig("python_maps/southern_africa_combined.pdf", dpi=300, bbox_inches='tight')
+    combined_fig = create_combined_layout(main_figs['southern_africa_map_with_boxes'], list(inset_figs.values()))
+    exports.append(save_figure(combined_fig, output_dir, "southern_africa_combined"))
     
     # Create dashboard
-    dashboard_fig = create_dashboard(main_fig, jhb_fig, cape_fig)
-    dashboard_fig.savefig("python_maps/southern_africa_dashboard.pdf", dpi=300, bbox_inches='tight')
+    dashboard_fig = create_dashboard(main_figs['southern_africa_map'], list(inset_figs.values()),
+                                     [inset['name'] for inset in insets])
+    exports.append(save_figure(dashboard_fig, output_dir, "southern_africa_dashboard"))
+    
+    # Precomputed layers for the R scripts and other renderers (left to the full-quality run)
+    if not preview.draft:
+        from layers import export_layer_bundle
+        export_layer_bundle(data, africa, southern_africa, insets, os.path.join(output_dir, "layers.gpkg"),
+                            source_path=data_path or base_data_path)
+    
+    # Report sizes and timings of everything written
+    export.print_export_report(exports)
+    export.write_export_report(exports, os.path.join(output_dir, "export_report.json"))
+    
+    print(f"Map generation complete. Files saved to '{output_dir}' directory.")
+    return 0
+
+# Read one registry version: a snapshot or a CSV (geocoded like base.csv)
+def read_version(path, gazetteer_file=None):
+    from snapshots import load_snapshot
+    if path.endswith('.parquet'):
+        print(f"Loading snapshot {path}")
+        return load_snapshot(path)
+    return read_registry(path, gazetteer_file)
+
+# Compare two registry versions, write the diff table and the what-changed map,
+# and optionally re-render only the outputs the changes touch
+def diff_versions(args):
+    from snapshots import list_snapshots, diff_registry, print_diff_summary, create_change_map
+    from watch import MapWatcher, affected_outputs
+    
+    versions = list(args.versions)
+    if len(versions) > 2:
+        print("diff takes at most two versions")
+        return 1
+    if len(versions) < 2:
+        # The current registry is the newer side; record it so the next diff starts here
+        previous = list_snapshots(args.snapshot_dir)
+        current = read_registry(args.data, args.gazetteer, snapshot_dir=args.snapshot_dir)
+        if current is None:
+            return 1
+        if not versions:
+            snapshots = list_snapshots(args.snapshot_dir)
+            older = [path for path in previous if path != snapshots[-1]]
+            if not older:
+                print(f"No earlier snapshot in {args.snapshot_dir} to compare with")
+                return 0
+            versions = [older[-1]]
+        old, new = read_version(versions[0], args.gazetteer), current
+    else:
+        old, new = (read_version(path, args.gazetteer) for path in versions)
+    if old is None or new is None:
+        return 1
+    
+    diff = diff_registry(old, new)
+    print_diff_summary(diff)
+    os.makedirs(args.output_dir, exist_ok=True)
+    table_path = os.path.join(args.output_dir, "what_changed.csv")
+    diff.to_csv(table_path, sep=';', index=False)
+    print(f"Saved {table_path}")
+    if diff.empty:
+        return 0
     
-    print("Map generation complete. Files saved to 'python_maps' directory.")
+    world, africa, southern_africa = load_map_data()
+    if world is not None:
+        fig, _ = create_change_map(diff, world, southern_africa)
+        save_figure(fig, args.output_dir, "what_changed", formats=('pdf', 'png'))
+    
+    old_data, new_data = prepare_map_data(old), prepare_map_data(new)
+    old_insets, new_insets = discover_insets(old_data), discover_insets(new_data)
+    names = affected_outputs(old_data, new_data, old_insets, new_insets)
+    print(f"Outputs affected: {', '.join(sorted(names)) or 'none'}")
+    if args.rebuild and names and africa is not None:
+        watcher = MapWatcher(args.data, args.output_dir, args.gazetteer)
+        watcher.data, watcher.insets = new_data, new_insets
+        watcher.africa, watcher.southern_africa = africa, southern_africa
+        watcher.render(names)
+    return 0
+
+# Command line interface: each subcommand only builds (and imports) what its outputs need
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Climate & health partner maps for Southern Africa")
+    parser.add_argument('--data', default=base_data_path, help="partner registry CSV (default: %(default)s)")
+    parser.add_argument('--gazetteer', default=gazetteer_path,
+                        help="local gazetteer used to fill missing coordinates (default: %(default)s)")
+    parser.add_argument('--output-dir', default="python_maps", help="output directory (default: %(default)s)")
+    parser.add_argument('--aggregate-above', type=int, default=density.aggregate_above, metavar='N',
+                        help="draw maps with more than N points as a density image (default: %(default)s)")
+    parser.add_argument('--insets', type=int, default=insets_module.inset_count, metavar='N',
+                        help="number of densest clusters drawn as inset maps (default: %(default)s)")
+    parser.add_argument('--thumbnail-width', type=int, default=export.thumbnail_width, metavar='PX',
+                        help="width of the PNG thumbnail saved with each output, 0 for none (default: %(default)s)")
+    parser.add_argument('--snapshot-dir', default=registry_snapshot_dir,
+                        help="where ingested registry versions are kept (default: %(default)s)")
+    parser.add_argument('--draft', action='store_true',
+                        help="fast low-resolution previews (<name>_draft.png) for layout iteration")
+    parser.add_argument('--refine', action='store_true',
+                        help="with --draft, re-render the same outputs at publication quality in the "
+                             "background and replace the drafts when done")
+    # Set by the background refinement run: where to move the finished outputs
+    parser.add_argument('--publish-to', help=argparse.SUPPRESS)
+    subparsers = parser.add_subparsers(dest='command')
+    
+    validate = subparsers.add_parser('validate', help="load and validate the registry, write the report")
+    validate.add_argument('--report', help="report path (default: <output-dir>/validation_report.json)")
+    
+    main_map = subparsers.add_parser('main-map', help="Southern Africa overview maps")
+    main_map.add_argument('--only', choices=['southern_africa_map', 'southern_africa_map_with_boxes'],
+                          help="regenerate a single overview map")
+    
+    inset = subparsers.add_parser('inset', help="inset maps of the densest clusters")
+    inset.add_argument('names', nargs='*', help="inset names, e.g. cape_town (default: all)")
+    
+    dashboard = subparsers.add_parser('dashboard', help="combined layout and dashboard")
+    dashboard.add_argument('--only', choices=['southern_africa_combined', 'southern_africa_dashboard'],
+                           help="regenerate a single layout")
+    
+    web = subparsers.add_parser('web', help="interactive HTML map")
+    web.add_argument('--output', help="HTML path (default: <output-dir>/southern_africa_web_map.html)")
+    
+    watch = subparsers.add_parser('watch', help="keep data and figures in memory, re-render on changes")
+    watch.add_argument('--interval', type=float, default=0.5, help="polling interval in seconds")
+    
+    serve = subparsers.add_parser('serve', help="local HTTP service rendering maps and charts on request")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--cache-mb', type=int, default=256, help="size of the rendered-output cache")
+    
+    store = subparsers.add_parser('store', help="write the registry to the indexed SQLite store")
+    store.add_argument('--db', default=registry_store_path, help="store path (default: %(default)s)")
+    
+    query = subparsers.add_parser('query', help="filter the registry through the indexed store")
+    query.add_argument('--db', default=registry_store_path, help="store path (default: %(default)s)")
+    query.add_argument('--country', action='append', help="country name (repeatable)")
+    query.add_argument('--city', action='append', help="city name (repeatable)")
+    query.add_argument('--role', action='append', default=[], help="role flag that must be 1, e.g. Research")
+    query.add_argument('--programme', action='append', default=[], help="programme flag that must be 1, e.g. HEAT")
+    query.add_argument('--bbox', type=float, nargs=4, metavar=('XMIN', 'XMAX', 'YMIN', 'YMAX'))
+    
+    subparsers.add_parser('proximity', help="nearest-partner distances and city coverage tables (CSV)")
+    
+    layers = subparsers.add_parser('layers', help="precomputed layer bundle for the R scripts and other renderers")
+    layers.add_argument('--output', help="GeoPackage (.gpkg) or GeoParquet directory "
+                                         "(default: <output-dir>/layers.gpkg)")
+    layers.add_argument('--force', action='store_true', help="rebuild even if the registry is unchanged")
+    
+    subparsers.add_parser('snapshot', help="record the current registry as a snapshot")
+    
+    diff = subparsers.add_parser('diff', help="what changed between two registry versions")
+    diff.add_argument('versions', nargs='*', metavar='VERSION',
+                      help="snapshot (.parquet) or registry CSV; with none, the current registry is "
+                           "compared to the last different snapshot, with one, to that version")
+    diff.add_argument('--rebuild', action='store_true', help="re-render the outputs the changes touch")
+    
+    subparsers.add_parser('all', help="every output (the default)")
+    return parser.parse_args(argv)
+
+def cli(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parse_args(argv)
+    command = args.command or 'all'
+    density.aggregate_above = args.aggregate_above
+    insets_module.inset_count = args.insets
+    export.thumbnail_width = args.thumbnail_width
+    preview.draft = args.draft
+    
+    if not args.publish_to:
+        status = render_command(args, command)
+    else:
+        # A background refinement must not leave its staging directory behind when it fails
+        try:
+            status = render_command(args, command)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+            status = 1
+    
+    # Figure commands can be refined in the background after a draft run
+    if command in ('all', 'main-map', 'inset', 'dashboard'):
+        if args.draft and args.refine and status == 0:
+            preview.start_refinement(argv, args.output_dir)
+        if args.publish_to:
+            if status == 0:
+                preview.publish(args.output_dir, args.publish_to)
+            else:
+                preview.discard(args.output_dir, f"exit status {status}")
+    return status
+
+# Run one subcommand and return its exit status
+def render_command(args, command):
+    if command == 'all':
+        return main(args.data, args.output_dir, args.gazetteer, args.snapshot_dir)
+    
+    if command == 'watch':
+        from watch import MapWatcher
+        return MapWatcher(args.data, args.output_dir, args.gazetteer, args.interval,
+                          args.snapshot_dir).run()
+    
+    if command == 'snapshot':
+        return 0 if read_registry(args.data, args.gazetteer, snapshot_dir=args.snapshot_dir) is not None else 1
+    
+    if command == 'diff':
+        return diff_versions(args)
+    
+    if command == 'serve':
+        from service import serve
+        return serve(args.data, args.gazetteer, args.host, args.port, args.cache_mb)
+    
+    if command in ('store', 'query'):
+        # Rebuild the store only when base.csv changed since it was written
+        if command == 'store' or not store_is_current(args.db, args.data):
+            if read_registry(args.data, args.gazetteer, store_path=args.db) is None:
+                return 1
+        if command == 'query':
+            with RegistryStore(args.db) as registry:
+                try:
+                    rows = registry.query(country=args.country, city=args.city, roles=args.role,
+                                          programmes=args.programme, bbox=args.bbox)
+                except ValueError as e:
+                    print(f"{e}; available: {', '.join(map(repr, ROLE_COLUMNS + PROGRAMME_COLUMNS))}")
+                    return 1
+            print(rows[['Institution', 'City', 'Country']].to_string(index=False))
+            print(f"{len(rows)} institutions")
+        return 0
+    
+    if command == 'layers':
+        from layers import bundle_is_current, export_layer_bundle
+        output = args.output or os.path.join(args.output_dir, "layers.gpkg")
+        # The preparation only runs when base.csv changed since the bundle was written
+        if not args.force and bundle_is_current(output, args.data):
+            print(f"Layer bundle {output} is up to date")
+            return 0
+        inputs = prepare_inputs(args.data, args.output_dir, args.gazetteer, report=False)
+        if inputs is None:
+            return 1
+        export_layer_bundle(*inputs, output, source_path=args.data)
+        return 0
+    
+    if command == 'proximity':
+        from proximity import city_coverage
+        data = load_data(args.data, args.gazetteer)
+        if data is None:
+            return 1
+        data = add_proximity_columns(data)
+        os.makedirs(args.output_dir, exist_ok=True)
+        columns = ['Institution', 'City', 'Country', 'nearest_partners', 'nearest_partner_km',
+                   'nearest_support_km', 'nearby_partners']
+        for name, table in (('proximity', data[columns]), ('city_coverage', city_coverage(data))):
+            path = os.path.join(args.output_dir, f"{name}.csv")
+            table.to_csv(path, sep=';', index=False, float_format='%.2f')
+            print(f"Saved {path}")
+        return 0
+    
+    if command == 'validate':
+        os.makedirs(args.output_dir, exist_ok=True)
+        report_path = args.report or os.path.join(args.output_dir, "validation_report.json")
+        data = load_data(args.data, args.gazetteer, report_path, snapshot_dir=args.snapshot_dir)
+        return 0 if data is not None else 1
+    
+    inputs = prepare_inputs(args.data, args.output_dir, args.gazetteer, report=False)
+    if inputs is None:
+        return 1
+    data, africa, southern_africa, insets = inputs
+    
+    if command == 'main-map':
+        names = [args.only] if args.only else None
+        for name, fig in build_main_maps(data, africa, southern_africa, insets, names).items():
+            save_figure(fig, args.output_dir, name)
+    
+    elif command == 'inset':
+        figures = build_inset_maps(data, insets, args.names or None)
+        if not figures:
+            print(f"No inset named {', '.join(args.names)}; available: "
+                  f"{', '.join(inset['slug'] for inset in insets)}")
+            return 1
+        for name, fig in figures.items():
+            save_figure(fig, args.output_dir, name, formats=('pdf', 'png'))
+    
+    elif command == 'dashboard':
+        inset_figs = list(build_inset_maps(data, insets).values())
+        if args.only in (None, 'southern_africa_combined'):
+            main_fig = build_main_maps(data, africa, southern_africa, insets,
+                                       ['southern_africa_map_with_boxes'])['southern_africa_map_with_boxes']
+            save_figure(create_combined_layout(main_fig, inset_figs), args.output_dir, "southern_africa_combined")
+        if args.only in (None, 'southern_africa_dashboard'):
+            main_fig = build_main_maps(data, africa, southern_africa, insets,
+                                       ['southern_africa_map'])['southern_africa_map']
+            save_figure(create_dashboard(main_fig, inset_figs, [inset['name'] for inset in insets]),
+                        args.output_dir, "southern_africa_dashboard")
+    
+    elif command == 'web':
+        output = args.output or os.path.join(args.output_dir, "southern_africa_web_map.html")
+        create_web_map(data, insets).save(output)
+        print(f"Saved {output}")
+    
+    return 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Aggregated rendering for very large point sets.
+#
+# Above aggregate_above points the maps stop drawing one vector marker per row.
+# Points are binned into a grid per FocusType with NumPy, and the counts are
+# shaded into a single RGBA image: each cell mixes the category colours by count
+# and gets more opaque with log density. The image is drawn with one imshow
+# call, so drawing time and PDF size no longer grow with the row count.
+
+# Point count above which maps switch to the aggregated image layer (None: never)
+aggregate_above = 20000
+
+# Grid cells across the map width
+GRID_WIDTH = 500
+
+# Lowest opacity of a non-empty cell, so isolated institutions stay visible
+MIN_ALPHA = 0.35
+
+# Only the highest-ranked major partners are labelled in aggregated maps
+AGGREGATED_LABEL_LIMIT = 40
+
+# Drawing order of the density image; labels go above it
+DENSITY_ZORDER = 10
+
+
+def should_aggregate(n_points, threshold=None):
+    threshold = aggregate_above if threshold is None else threshold
+    return threshold is not None and n_points > threshold
+
+
+def grid_shape(extent, width=GRID_WIDTH):
+    """(rows, cols) of a grid with square cells covering extent."""
+    xmin, xmax, ymin, ymax = extent
+    rows = int(round(width * (ymax - ymin) / (xmax - xmin)))
+    return max(rows, 1), width
+
+
+def density_grid(x, y, codes, n_categories, extent, shape):
+    """Point counts per category and cell, as an array of shape (n_categories, rows, cols).
+
+    codes holds each point's category number; points with a negative code or
+    outside extent are ignored.
+    """
+    xmin, xmax, ymin, ymax = extent
+    rows, cols = shape
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    codes = np.asarray(codes)
+
+    inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax) & (codes >= 0)
+    col = np.minimum(((x[inside] - xmin) / (xmax - xmin) * cols).astype(np.intp), cols - 1)
+    row = np.minimum(((y[inside] - ymin) / (ymax - ymin) * rows).astype(np.intp), rows - 1)
+    flat = (codes[inside].astype(np.intp) * rows + row) * cols + col
+    counts = np.bincount(flat, minlength=n_categories * rows * cols)
+    return counts.reshape(n_categories, rows, cols)
+
+
+def shade(counts, colors, min_alpha=MIN_ALPHA):
+    """RGBA image (rows, cols, 4) from per-category counts and one colour per category."""
+    from matplotlib.colors import to_rgb
+
+    rgb = np.array([to_rgb(color) for color in colors])
+    total = counts.sum(axis=0)
+    mixed = np.einsum('krc,kd->rcd', counts, rgb) / np.maximum(total, 1)[..., None]
+
+    alpha = np.zeros(total.shape)
+    filled = total > 0
+    if filled.any():
+        log_total = np.log1p(total)
+        alpha[filled] = min_alpha + (1 - min_alpha) * log_total[filled] / log_total.max()
+    return np.dstack([mixed, alpha])
+
+
+def draw_density(ax, x, y, categories, palette, extent, width=GRID_WIDTH, zorder=DENSITY_ZORDER):
+    """Draw points as one aggregated image, coloured by category through palette."""
+    names = list(palette)
+    codes = pd.Categorical(np.asarray(categories), categories=names).codes
+    counts = density_grid(x, y, codes, len(names), extent, grid_shape(extent, width))
+    image = shade(counts, [palette[name] for name in names])
+
+    xmin, xmax, ymin, ymax = extent
+    drawn = ax.imshow(image, extent=(xmin, xmax, ymin, ymax), origin='lower', interpolation='nearest',
+                      aspect=ax.get_aspect(), zorder=zorder)
+    print(f"Aggregated {int(counts.sum())} points into a {image.shape[1]}x{image.shape[0]} density image")
+    return drawn
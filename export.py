@@ -0,0 +1,168 @@
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+# Render-once export of finished figures.
+#
+# fig.savefig(..., bbox_inches='tight') lays the figure out and draws it again
+# for every file it writes. export_figure() instead computes the tight bounding
+# box once, renders the raster version once with Agg and encodes the PNG and a
+# downscaled thumbnail from those same pixels (outputs without a raster format
+# are rendered at just enough resolution for the thumbnail). Vector formats
+# (PDF, SVG) still need their own pass each, but reuse the precomputed box.
+# export_draft() goes further for previews: one draw of the figure canvas,
+# cropped to the tight box measured during that same draw.
+
+EXPORT_DPI = 300
+
+RASTER_FORMATS = ('png', 'jpg', 'jpeg')
+
+# Width in pixels of the PNG thumbnail written next to every output (0 or None: none)
+thumbnail_width = 480
+
+
+def tight_bbox(fig, dpi=EXPORT_DPI):
+    """The box bbox_inches='tight' would use, from a single layout pass without output."""
+    import matplotlib
+
+    # Text extents depend on the dpi, so lay out at the export resolution like savefig does
+    figure_dpi = fig.dpi
+    fig.set_dpi(dpi)
+    try:
+        fig.draw_without_rendering()
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+    finally:
+        fig.set_dpi(figure_dpi)
+    return bbox.padded(matplotlib.rcParams['savefig.pad_inches'])
+
+
+def render_rgba(fig, bbox, dpi=EXPORT_DPI):
+    """Pixels of the figure cropped to bbox, as a (rows, cols, 4) uint8 array."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='rgba', dpi=dpi, bbox_inches=bbox)
+    # Agg truncates the canvas size to whole pixels
+    width = int(bbox.width * dpi)
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8).reshape(-1, width, 4)
+
+
+def render_cropped(fig, dpi):
+    """Pixels of the figure drawn once at dpi and cropped to its tight bounding box.
+
+    Unlike bbox_inches='tight', artists reaching past the figure edge are cut
+    off instead of enlarging the image, so this is only used for drafts.
+    """
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure_dpi = fig.dpi
+    fig.set_dpi(dpi)
+    try:
+        canvas = fig.canvas if isinstance(fig.canvas, FigureCanvasAgg) else FigureCanvasAgg(fig)
+        canvas.draw()
+        bbox = fig.get_tightbbox(canvas.get_renderer()).padded(matplotlib.rcParams['savefig.pad_inches'])
+        pixels = np.asarray(canvas.buffer_rgba()).copy()
+    finally:
+        fig.set_dpi(figure_dpi)
+
+    # Display coordinates count rows from the bottom of the canvas
+    height, width = pixels.shape[:2]
+    x0, x1 = max(int(bbox.x0 * dpi), 0), min(int(np.ceil(bbox.x1 * dpi)), width)
+    y0, y1 = max(int(bbox.y0 * dpi), 0), min(int(np.ceil(bbox.y1 * dpi)), height)
+    return pixels[height - y1:height - y0, x0:x1]
+
+
+def _file_record(path, fmt, seconds):
+    return {'path': path, 'format': fmt, 'bytes': os.path.getsize(path), 'seconds': round(seconds, 3)}
+
+
+def export_figure(fig, output_dir, name, formats=('pdf',), dpi=EXPORT_DPI, thumbnail=None):
+    """Write output_dir/name.<fmt> for every format, plus name_thumb.png, from one render.
+
+    thumbnail is the thumbnail width in pixels (default: the module's
+    thumbnail_width). Returns the output name, the layout and raster render
+    times, and path, format, size and time of every file written.
+    """
+    from PIL import Image
+
+    thumbnail = thumbnail_width if thumbnail is None else thumbnail
+    result = {'name': name, 'files': []}
+
+    start = time.perf_counter()
+    bbox = tight_bbox(fig, dpi)
+    result['layout_seconds'] = round(time.perf_counter() - start, 3)
+
+    raster = [fmt for fmt in formats if fmt in RASTER_FORMATS]
+    if raster or thumbnail:
+        # A thumbnail on its own only needs twice its width in pixels to downscale from
+        raster_dpi = dpi if raster else min(dpi, int(np.ceil(2 * thumbnail / bbox.width)))
+        start = time.perf_counter()
+        image = Image.fromarray(render_rgba(fig, bbox, raster_dpi), 'RGBA')
+        result['raster_seconds'] = round(time.perf_counter() - start, 3)
+
+        for fmt in raster:
+            start = time.perf_counter()
+            path = os.path.join(output_dir, f"{name}.{fmt}")
+            (image if fmt == 'png' else image.convert('RGB')).save(path, dpi=(dpi, dpi))
+            result['files'].append(_file_record(path, fmt, time.perf_counter() - start))
+
+        if thumbnail:
+            start = time.perf_counter()
+            path = os.path.join(output_dir, f"{name}_thumb.png")
+            height = max(1, round(image.height * thumbnail / image.width))
+            image.resize((thumbnail, height), Image.LANCZOS).save(path)
+            result['files'].append(_file_record(path, 'thumbnail', time.perf_counter() - start))
+
+    for fmt in formats:
+        if fmt in RASTER_FORMATS:
+            continue
+        start = time.perf_counter()
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        fig.savefig(path, format=fmt, dpi=dpi, bbox_inches=bbox)
+        result['files'].append(_file_record(path, fmt, time.perf_counter() - start))
+
+    return result
+
+
+def export_draft(fig, output_dir, name, dpi):
+    """Write output_dir/name.png from a single draw of the figure; same result layout as export_figure."""
+    from PIL import Image
+
+    start = time.perf_counter()
+    image = Image.fromarray(render_cropped(fig, dpi), 'RGBA')
+    result = {'name': name, 'layout_seconds': 0.0, 'raster_seconds': round(time.perf_counter() - start, 3),
+              'files': []}
+
+    start = time.perf_counter()
+    path = os.path.join(output_dir, f"{name}.png")
+    image.save(path, dpi=(dpi, dpi))
+    result['files'].append(_file_record(path, 'png', time.perf_counter() - start))
+    return result
+
+
+def _size(n_bytes):
+    if n_bytes < 1024:
+        return f"{n_bytes} B"
+    if n_bytes < 1024 ** 2:
+        return f"{n_bytes / 1024:.1f} KB"
+    return f"{n_bytes / 1024 ** 2:.1f} MB"
+
+
+def print_export_report(results):
+    total_bytes = sum(f['bytes'] for r in results for f in r['files'])
+    total_seconds = sum(r['layout_seconds'] + r.get('raster_seconds', 0) + sum(f['seconds'] for f in r['files'])
+                        for r in results)
+    print(f"Exported {sum(len(r['files']) for r in results)} files ({_size(total_bytes)}) in {total_seconds:.2f}s")
+    for r in results:
+        shared = r['layout_seconds'] + r.get('raster_seconds', 0)
+        print(f"  {r['name']}: layout + render {shared:.2f}s")
+        for f in r['files']:
+            print(f"    {os.path.basename(f['path']):<48} {_size(f['bytes']):>10} {f['seconds']:>7.2f}s")
+
+
+def write_export_report(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Export report written to {path}")
@@ -0,0 +1,186 @@
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Offline geocoding of registry rows that have no lon/lat.
+#
+# Coordinates are resolved from a local gazetteer file, either a GeoNames dump
+# (allCountries.txt, cities500.txt, ... - tab separated, no header) or a small
+# semicolon separated CSV with City;Country;lon;lat columns like base.csv.
+# The gazetteer is indexed once into a dict keyed by normalized (city, country)
+# and every lookup result is kept in a JSON cache next to it, so later runs only
+# touch the gazetteer when a new (city, country) pair shows up.
+
+# GeoNames dump columns (see readme.txt shipped with the dumps)
+GEONAMES_COLUMNS = [
+    'geonameid', 'name', 'asciiname', 'alternatenames', 'latitude', 'longitude',
+    'feature_class', 'feature_code', 'country_code', 'cc2', 'admin1_code',
+    'admin2_code', 'admin3_code', 'admin4_code', 'population', 'elevation',
+    'dem', 'timezone', 'modification_date'
+]
+
+# Country names as written in base.csv -> ISO 3166-1 alpha-2 codes used by GeoNames
+country_codes = {
+    "Angola": "AO", "Austria": "AT", "Belgium": "BE", "Botswana": "BW",
+    "Burkina Faso": "BF", "Burundi": "BI", "Cameroon": "CM", "Chad": "TD",
+    "Cote d'Ivoire": "CI", "Ivory Coast": "CI", "Denmark": "DK", "Estonia": "EE",
+    "Eswatini": "SZ", "Swaziland": "SZ", "Ethiopia": "ET", "Finland": "FI",
+    "France": "FR", "Germany": "DE", "Ghana": "GH", "Greece": "GR",
+    "Ireland": "IE", "Italy": "IT", "Kenya": "KE", "Lesotho": "LS",
+    "Malawi": "MW", "Mauritania": "MR", "Mozambique": "MZ", "Namibia": "NA",
+    "Netherlands": "NL", "Nigeria": "NG", "Norway": "NO", "Rwanda": "RW",
+    "Senegal": "SN", "South Africa": "ZA", "South Korea": "KR", "Spain": "ES",
+    "Sweden": "SE", "Switzerland": "CH", "Tanzania": "TZ", "Togo": "TG",
+    "Uganda": "UG", "United Kingdom": "GB", "United States": "US",
+    "Zambia": "ZM", "Zimbabwe": "ZW"
+}
+
+
+def normalize_place(name):
+    """Lower-case, accent-free, punctuation-free form of a place name."""
+    if not isinstance(name, str):
+        return ''
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    name = name.encode('ascii', 'ignore').decode('ascii').casefold()
+    return re.sub(r'[^a-z0-9]+', ' ', name).strip()
+
+
+def normalize_places(values):
+    # Vectorized equivalent of normalize_place for a pandas Series
+    values = values.fillna('').astype(str).str.normalize('NFKD')
+    values = values.str.encode('ascii', 'ignore').str.decode('ascii').str.casefold()
+    return values.str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+
+
+_normalized_country_codes = {normalize_place(k): v for k, v in country_codes.items()}
+
+
+def _country_key(country):
+    # GeoNames stores ISO codes, so registry country names are keyed by their code
+    key = normalize_place(country)
+    return _normalized_country_codes.get(key, key).lower()
+
+
+def load_gazetteer(gazetteer_path):
+    """Build the in-memory {(city, country): (lon, lat)} index from a gazetteer file."""
+    print(f"Indexing gazetteer {gazetteer_path}")
+
+    if gazetteer_path.lower().endswith('.csv'):
+        places = pd.read_csv(gazetteer_path, sep=';', usecols=['City', 'Country', 'lon', 'lat'])
+        places = places.dropna(subset=['lon', 'lat'])
+        cities = normalize_places(places['City'])
+        countries = pd.Series([_country_key(c) for c in places['Country']], index=places.index)
+        keys = pd.DataFrame({'city': cities, 'country': countries,
+                             'lon': places['lon'], 'lat': places['lat']})
+    else:
+        places = pd.read_csv(gazetteer_path, sep='\t', header=None, names=GEONAMES_COLUMNS,
+                             usecols=['name', 'asciiname', 'latitude', 'longitude',
+                                      'feature_class', 'country_code', 'population'],
+                             dtype={'country_code': str}, keep_default_na=False,
+                             na_values={'latitude': [''], 'longitude': [''], 'population': ['']},
+                             quoting=3, encoding='utf-8')
+        # Only populated places (feature class P); larger towns win on duplicate names
+        places = places[places['feature_class'] == 'P']
+        places = places.sort_values('population', ascending=False, kind='stable')
+        countries = places['country_code'].str.lower()
+        keys = pd.concat([
+            pd.DataFrame({'city': normalize_places(places[col]), 'country': countries,
+                          'lon': places['longitude'], 'lat': places['latitude']})
+            for col in ('name', 'asciiname')
+        ])
+
+    keys = keys[keys['city'] != ''].drop_duplicates(subset=['city', 'country'], keep='first')
+    index = dict(zip(zip(keys['city'], keys['country']),
+                     zip(keys['lon'].astype(float), keys['lat'].astype(float))))
+    print(f"Indexed {len(index)} places")
+    return index
+
+
+def _cache_source(gazetteer_path):
+    stat = os.stat(gazetteer_path)
+    return {'path': os.path.abspath(gazetteer_path), 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def _read_cache(cache_path, source):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable geocoding cache {cache_path}: {e}")
+        return {}
+    # A different or updated gazetteer invalidates everything, including misses
+    if cached.get('source') != source:
+        return {}
+    return cached.get('entries', {})
+
+
+def _write_cache(cache_path, source, entries):
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': source, 'entries': entries}, f)
+    os.replace(tmp_path, cache_path)
+
+
+def geocode_places(cities, countries, gazetteer_path, cache_path=None):
+    """Batch lookup of (city, country) pairs; returns (lon, lat) arrays with NaN for misses."""
+    source = _cache_source(gazetteer_path)
+    entries = _read_cache(cache_path, source)
+
+    city_keys = normalize_places(pd.Series(cities, dtype=object))
+    country_keys = pd.Series([_country_key(c) for c in countries], index=city_keys.index)
+    lookup_keys = city_keys + '|' + country_keys
+
+    # Resolve each distinct pair once; the gazetteer is only read on a cache miss
+    unique_keys = pd.unique(lookup_keys)
+    missing = [key for key in unique_keys if key not in entries]
+    if missing:
+        index = load_gazetteer(gazetteer_path)
+        for key in missing:
+            city, country = key.split('|', 1)
+            hit = index.get((city, country))
+            entries[key] = list(hit) if hit is not None else None
+        if cache_path is not None:
+            _write_cache(cache_path, source, entries)
+
+    resolved = [entries[key] or (np.nan, np.nan) for key in unique_keys]
+    coords = pd.DataFrame(resolved, index=unique_keys, columns=['lon', 'lat'], dtype=float)
+    coords = coords.reindex(lookup_keys.to_numpy())
+    return coords['lon'].to_numpy(), coords['lat'].to_numpy()
+
+
+def fill_missing_coordinates(data, gazetteer_path, cache_path=None):
+    """Fill empty lon/lat in the registry from the gazetteer, flagging filled rows in 'geocoded'."""
+    data = data.copy()
+    data['geocoded'] = False
+
+    missing = data['lon'].isna() | data['lat'].isna()
+    if not missing.any():
+        return data
+
+    if gazetteer_path is None or not os.path.exists(gazetteer_path):
+        print(f"{missing.sum()} rows have no coordinates and no gazetteer is available")
+        return data
+
+    if cache_path is None:
+        cache_path = f"{os.path.splitext(gazetteer_path)[0]}_geocode_cache.json"
+
+    lon, lat = geocode_places(data.loc[missing, 'City'], data.loc[missing, 'Country'],
+                              gazetteer_path, cache_path)
+    found = ~(np.isnan(lon) | np.isnan(lat))
+
+    rows = data.index[missing]
+    data.loc[rows[found], 'lon'] = lon[found]
+    data.loc[rows[found], 'lat'] = lat[found]
+    data.loc[rows[found], 'geocoded'] = True
+
+    print(f"Geocoded {found.sum()} of {missing.sum()} rows missing coordinates")
+    for _, row in data.loc[rows[~found]].iterrows():
+        print(f"  No gazetteer match for {row['Institution']} ({row['City']}, {row['Country']})")
+    return data
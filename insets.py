@@ -0,0 +1,124 @@
+import re
+
+import numpy as np
+
+# Automatic discovery of inset areas from point density.
+#
+# Points are binned into a regular lon/lat grid and every occupied cell is
+# scored by the number of points in its 3x3 neighbourhood. Cells are then taken
+# greedily from the densest down: each pick claims its neighbourhood, becomes a
+# padded bbox around the points it contains, and is named after its main cities.
+# A pick whose bbox overlaps an earlier one is the same metro spilling past the
+# neighbourhood and is skipped, and repeated names get numbered slugs.
+
+# Number of insets drawn (set from --insets)
+inset_count = 2
+
+# Grid cell size in degrees; a 3x3 neighbourhood spans roughly 150 km
+INSET_CELL_SIZE = 0.5
+
+# Colours for the overview boxes, in order of inset density
+inset_colors = ["#0F1F2C", "#CD1A1B", "#1E4611", "#90876E"]
+
+_NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def _cell_codes(cx, cy):
+    # Pack integer cell coordinates into one sortable int64 key
+    return (cx.astype(np.int64) << 32) + (cy.astype(np.int64) & 0xFFFFFFFF)
+
+
+def inset_name(cities, min_share=0.2):
+    """Title for an inset: its most common city, plus the runner-up if it holds min_share."""
+    values, counts = np.unique(np.asarray(cities, dtype=str), return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    names = [values[order[0]]]
+    if len(order) > 1 and counts[order[1]] > 1 and counts[order[1]] >= min_share * counts.sum():
+        names.append(values[order[1]])
+    return " & ".join(names)
+
+
+def inset_slug(name):
+    """File-name form of an inset name, e.g. 'cape_town'."""
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+
+
+def _overlaps(bbox, other):
+    return bbox[0] < other[1] and other[0] < bbox[1] and bbox[2] < other[3] and other[2] < bbox[3]
+
+
+def discover_insets(data, top_n=None, min_points=4, cell_size=INSET_CELL_SIZE,
+                    pad_fraction=0.15, min_pad=0.1):
+    """Find the top_n (default: inset_count) densest point clusters and return them as inset definitions.
+
+    Each inset is a dict with 'name', 'slug', 'bbox' ([xmin, xmax, ymin, ymax]),
+    'count' and 'color', ordered from the densest cluster down.
+    """
+    top_n = inset_count if top_n is None else top_n
+    lon = data.geometry.x.to_numpy()
+    lat = data.geometry.y.to_numpy()
+    valid = ~(np.isnan(lon) | np.isnan(lat))
+    lon, lat = lon[valid], lat[valid]
+    cities = data['City'].fillna('').to_numpy()[valid] if 'City' in data.columns else None
+    if len(lon) == 0:
+        return []
+
+    cell_x = np.floor(lon / cell_size).astype(np.int64)
+    cell_y = np.floor(lat / cell_size).astype(np.int64)
+    codes = _cell_codes(cell_x, cell_y)
+    cells, point_cell, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    cells_x = cells >> 32
+    cells_y = (cells & 0xFFFFFFFF).astype(np.int32).astype(np.int64)
+
+    # 3x3 neighbourhood totals for every occupied cell
+    neighbourhood = np.zeros(len(cells), dtype=np.int64)
+    neighbour_index = []
+    for dx, dy in _NEIGHBOURS:
+        target = _cell_codes(cells_x + dx, cells_y + dy)
+        pos = np.clip(np.searchsorted(cells, target), 0, len(cells) - 1)
+        hit = cells[pos] == target
+        neighbourhood += np.where(hit, counts[pos], 0)
+        neighbour_index.append(np.where(hit, pos, -1))
+    neighbour_index = np.stack(neighbour_index, axis=1)
+
+    claimed = np.zeros(len(cells), dtype=bool)
+    insets = []
+    for cell in np.argsort(-neighbourhood, kind='stable'):
+        if len(insets) >= top_n:
+            break
+        if claimed[cell]:
+            continue
+        members = neighbour_index[cell]
+        members = members[(members >= 0) & ~claimed[np.maximum(members, 0)]]
+        in_cluster = np.isin(point_cell, members)
+        if in_cluster.sum() < min_points:
+            continue
+        claimed[members] = True
+
+        xs, ys = lon[in_cluster], lat[in_cluster]
+        pad_x = max(pad_fraction * (xs.max() - xs.min()), min_pad)
+        pad_y = max(pad_fraction * (ys.max() - ys.min()), min_pad)
+        bbox = [round(xs.min() - pad_x, 4), round(xs.max() + pad_x, 4),
+                round(ys.min() - pad_y, 4), round(ys.max() + pad_y, 4)]
+        if any(_overlaps(bbox, inset['bbox']) for inset in insets):
+            continue
+
+        name = inset_name(cities[in_cluster]) if cities is not None else f"Inset {len(insets) + 1}"
+        # Output files are named after the slug, so it must be unique
+        slug = base_slug = inset_slug(name)
+        taken = {inset['slug'] for inset in insets}
+        number = 1
+        while slug in taken:
+            number += 1
+            slug = f"{base_slug}_{number}"
+        insets.append({
+            'name': name,
+            'slug': slug,
+            'bbox': bbox,
+            'count': int(in_cluster.sum()),
+            'color': inset_colors[len(insets) % len(inset_colors)],
+        })
+
+    for inset in insets:
+        print(f"Discovered inset {inset['name']}: {inset['count']} points, bbox {inset['bbox']}")
+    return insets
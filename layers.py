@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import time
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point, box
+
+from colocation import displaced_xy
+from layout import color_palette, main_map_colocation_radius, main_map_extent, main_map_labels
+from proximity import add_proximity_columns
+from registry_store import PROGRAMME_COLUMNS, ROLE_COLUMNS, source_stamp
+from snapshots import content_hash
+
+# Precomputed map layers shared by the Python and R renderers.
+#
+# The expensive preparation (geocoding, validation, Southern Africa filter,
+# FocusType and major-partner classification, co-location offsets, proximity,
+# inset discovery, label placement, boundary simplification) runs once per
+# registry change and is written as one bundle that any renderer can read:
+#
+#   points      classified institutions, one row per marker
+#   boundaries  African country outlines, simplified, flagged in_southern_africa
+#   insets      inset areas as rectangles, densest first
+#   labels      overview-map label positions with the point each label belongs to
+#   styles      focus-area colours
+#   meta        schema version, source file stamp and registry content hash
+#
+# A path ending in .gpkg is written as one GeoPackage with a layer per table;
+# any other path becomes a directory of GeoParquet files plus meta.json.
+# read_layer_bundle.R reads the GeoPackage from R.
+
+LAYER_SCHEMA_VERSION = 1
+
+# Boundary simplification tolerance in degrees (about 1 km)
+BOUNDARY_TOLERANCE = 0.01
+
+POINT_COLUMNS = [
+    'Institution', 'Short_Name', 'City', 'Country', 'lon', 'lat', 'FocusType', 'Shape',
+    'focus_count', 'is_major_partner', 'label_text', 'colocated_group', 'colocated_size',
+    'offset_dx', 'offset_dy', 'plot_lon', 'plot_lat', 'nearest_partners', 'nearest_partner_km',
+    'nearest_support_km', 'nearby_partners'
+] + ROLE_COLUMNS + PROGRAMME_COLUMNS
+
+CRS = "EPSG:4326"
+
+
+def build_layers(data, africa, southern_africa, insets):
+    """Every bundle table as {layer name: GeoDataFrame or DataFrame}."""
+    plot_lon, plot_lat = displaced_xy(data, main_map_colocation_radius)
+    points = add_proximity_columns(data).assign(plot_lon=plot_lon, plot_lat=plot_lat,
+                         label_text=data['Short_Name'].where(data['is_major_partner']))
+    points = points[[c for c in POINT_COLUMNS if c in points.columns] + ['geometry']].reset_index(drop=True)
+
+    boundaries = africa[['name', 'iso_a3', 'continent', 'geometry']].copy()
+    boundaries['in_southern_africa'] = boundaries['name'].isin(southern_africa['name'])
+    boundaries['geometry'] = boundaries.geometry.simplify(BOUNDARY_TOLERANCE, preserve_topology=True)
+    boundaries = boundaries.reset_index(drop=True)
+
+    inset_rows = [{'rank': i + 1, 'name': inset['name'], 'slug': inset['slug'], 'color': inset['color'],
+                   'count': inset['count'], 'xmin': inset['bbox'][0], 'xmax': inset['bbox'][1],
+                   'ymin': inset['bbox'][2], 'ymax': inset['bbox'][3]} for i, inset in enumerate(insets)]
+    inset_layer = gpd.GeoDataFrame(
+        pd.DataFrame(inset_rows, columns=['rank', 'name', 'slug', 'color', 'count', 'xmin', 'xmax', 'ymin', 'ymax']),
+        geometry=[box(r['xmin'], r['ymin'], r['xmax'], r['ymax']) for r in inset_rows], crs=CRS)
+
+    labeled = main_map_labels(data.assign(plot_x=plot_lon, plot_y=plot_lat))
+    labels = gpd.GeoDataFrame({
+        'Institution': labeled['Institution'].to_numpy(),
+        'label_text': labeled['Short_Name'].to_numpy(),
+        'anchor_lon': labeled['plot_x'].to_numpy(),
+        'anchor_lat': labeled['plot_y'].to_numpy(),
+    }, geometry=[Point(xy) for xy in zip(labeled['label_x'], labeled['label_y'])], crs=CRS)
+
+    styles = pd.DataFrame({'FocusType': list(color_palette),
+                           'color': list(color_palette.values())})
+
+    return {'points': points, 'boundaries': boundaries, 'insets': inset_layer,
+            'labels': labels, 'styles': styles}
+
+
+def _meta_table(meta):
+    return pd.DataFrame({'key': list(meta), 'value': [str(v) for v in meta.values()]})
+
+
+def write_layer_bundle(layers, path, meta):
+    """Write layers and meta to path (GeoPackage or GeoParquet directory), replacing it atomically."""
+    tmp_path = f"{path}.tmp"
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    tables = dict(layers, meta=_meta_table(meta))
+    if path.endswith('.gpkg'):
+        for name, table in tables.items():
+            if not isinstance(table, gpd.GeoDataFrame):
+                # Attribute-only tables go in as layers without geometry
+                table = gpd.GeoDataFrame(table, geometry=gpd.GeoSeries([None] * len(table), crs=CRS))
+            table.to_file(tmp_path, layer=name, driver='GPKG')
+    else:
+        os.makedirs(tmp_path)
+        for name, table in tables.items():
+            table.to_parquet(os.path.join(tmp_path, f"{name}.parquet"), index=False)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({key: str(value) for key, value in meta.items()}, f, indent=2)
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    print(f"Wrote layer bundle {path} ({', '.join(f'{name}: {len(t)}' for name, t in layers.items())})")
+
+
+def read_bundle_meta(path):
+    """The bundle's meta table as a dict, or None if there is no readable bundle at path."""
+    try:
+        if path.endswith('.gpkg'):
+            meta = gpd.read_file(path, layer='meta')
+            return dict(zip(meta['key'], meta['value']))
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def bundle_is_current(path, source_path):
+    """True if the bundle at path was built by this schema from the current source_path."""
+    meta = read_bundle_meta(path)
+    if meta is None:
+        return False
+    expected = dict(source_stamp(source_path), schema_version=str(LAYER_SCHEMA_VERSION))
+    return all(meta.get(key) == value for key, value in expected.items())
+
+
+def export_layer_bundle(data, africa, southern_africa, insets, path, source_path=None):
+    meta = {'schema_version': LAYER_SCHEMA_VERSION, 'crs': CRS,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'registry_hash': content_hash(pd.DataFrame(data.drop(columns='geometry'))),
+            'main_map_extent': ','.join(str(v) for v in main_map_extent)}
+    if source_path is not None:
+        meta.update(source_stamp(source_path))
+    write_layer_bundle(build_layers(data, africa, southern_africa, insets), path, meta)
+    return path
@@ -0,0 +1,139 @@
+import numpy as np
+
+from density import AGGREGATED_LABEL_LIMIT
+
+# Styling and layout shared by the map renderers.
+#
+# The focus-area palette, the overview map extent and the label placement live
+# here rather than in the create_map.py script, so that the layer bundle and
+# watch mode use the same values without importing the command-line script.
+
+# Define color palette
+color_palette = {
+    "Research": "#0F1F2C",
+    "Finance and Programmes": "#90876E",
+    "Engagement, Advocacy and Capacity Building": "#1E4611",
+    "Policy": "#CD1A1B"
+}
+
+# Overview map extent [xmin, xmax, ymin, ymax] and how far apart co-located points are spread on it
+main_map_extent = [10, 40, -35, 0]
+main_map_colocation_radius = 0.3
+
+
+# Major partners labelled on the overview map, with label_x/label_y positions that keep
+# clear of earlier labels (when aggregated, labels with no free position are dropped rather
+# than stacked); data needs the displaced plot_x/plot_y marker positions
+def main_map_labels(data, aggregated=False):
+    used_positions = {}  # Keep track of label positions
+    
+    # Sort by latitude to prioritize placement
+    labeled_data = data[data['is_major_partner']]
+    if aggregated:
+        labeled_data = labeled_data.nlargest(AGGREGATED_LABEL_LIMIT, 'focus_count')
+    labeled_data = labeled_data.sort_values('lat')
+    
+    label_positions = []
+    for idx, row in labeled_data.iterrows():
+        x, y = row['plot_x'], row['plot_y']
+        full_name = row['Institution']  # Use full institution name
+        
+        # Initialize label position
+        label_x = x + 0.05
+        label_y = y + 0.05
+        placed = False
+        
+        # Check for overlaps and adjust position
+        offsets = [(0.05, 0.05), (-0.05, 0.05), (0.05, -0.05), (-0.05, -0.05),
+                  (0.1, 0), (-0.1, 0), (0, 0.1), (0, -0.1)]
+        
+        for dx, dy in offsets:
+            test_x = x + dx
+            test_y = y + dy
+            
+            # Check if this position is far enough from other labels
+            position_ok = True
+            for used_x, used_y in used_positions.values():
+                if abs(test_x - used_x) < 0.2 and abs(test_y - used_y) < 0.1:
+                    position_ok = False
+                    break
+            
+            if position_ok:
+                label_x = test_x
+                label_y = test_y
+                placed = True
+                break
+        
+        # Aggregated maps label dense areas; leave out what does not fit
+        if aggregated and not placed:
+            label_positions.append((np.nan, np.nan))
+            continue
+        
+        # Store the used position
+        used_positions[full_name] = (label_x, label_y)
+        label_positions.append((label_x, label_y))
+    
+    label_positions = np.array(label_positions, dtype=float).reshape(-1, 2)
+    labeled_data = labeled_data.assign(label_x=label_positions[:, 0], label_y=label_positions[:, 1])
+    return labeled_data.dropna(subset=['label_x', 'label_y'])
+
+
+# Institutions labelled on an inset map (every one, or the top major partners when aggregated),
+# with label_x/label_y positions that keep clear of earlier labels (when aggregated, labels
+# with no free position are dropped rather than stacked); data needs plot_x/plot_y
+def inset_map_labels(data, aggregated=False):
+    used_positions = {}  # Keep track of label positions
+    
+    labeled_data = data
+    if aggregated:
+        labeled_data = data[data['is_major_partner']].nlargest(AGGREGATED_LABEL_LIMIT, 'focus_count')
+    
+    # Sort institutions by latitude to prioritize positioning
+    labeled_data = labeled_data.sort_values(by=['lat'])
+    
+    # Candidate offsets at growing distances (further from points to reduce clutter), 8 directions each
+    offsets = []
+    for dist in [0.02, 0.03, 0.04, 0.05]:
+        for angle in [0, 45, 90, 135, 180, 225, 270, 315]:
+            rad = np.radians(angle)
+            offsets.append((dist * np.cos(rad), dist * np.sin(rad)))
+    
+    label_positions = []
+    for idx, row in labeled_data.iterrows():
+        x, y = row['plot_x'], row['plot_y']
+        full_name = row['Institution']  # Use full institution name
+        
+        # Check for overlaps with much larger minimum distances
+        label_x, label_y = x, y  # Default position
+        placed = False
+        
+        for dx, dy in offsets:
+            test_x = x + dx
+            test_y = y + dy
+            
+            # Increase minimum spacing between labels
+            position_ok = True
+            for used_x, used_y in used_positions.values():
+                # Increase these values to enforce more space between labels
+                if abs(test_x - used_x) < 0.3 and abs(test_y - used_y) < 0.2:
+                    position_ok = False
+                    break
+            
+            if position_ok:
+                label_x = test_x
+                label_y = test_y
+                placed = True
+                break
+        
+        # Aggregated maps label dense areas; leave out what does not fit
+        if aggregated and not placed:
+            label_positions.append((np.nan, np.nan))
+            continue
+        
+        # Store the used position
+        used_positions[full_name] = (label_x, label_y)
+        label_positions.append((label_x, label_y))
+    
+    label_positions = np.array(label_positions, dtype=float).reshape(-1, 2)
+    labeled_data = labeled_data.assign(label_x=label_positions[:, 0], label_y=label_positions[:, 1])
+    return labeled_data.dropna(subset=['label_x', 'label_y'])
@@ -0,0 +1,131 @@
+import numpy as np
+
+# Batched marker and label drawing for the map builders.
+#
+# Instead of one scatter call per FocusType and shape, point_styles() turns the
+# style tables below into per-point colour, marker, size and zorder arrays in
+# one pass, and draw_points() draws them as one PathCollection per zorder level
+# (a PathCollection can hold a different marker path per point). Labels are
+# plain text artists and their leader lines are a single LineCollection.
+# legend_handles() builds the legend from the same tables, so legend and
+# markers cannot drift apart.
+
+# Marker shape per Shape value (Data_Providers == 1 is 'triangle')
+SHAPE_MARKERS = {
+    'circle': 'o',
+    'triangle': '^',
+}
+
+SHAPE_LABELS = {
+    'circle': 'Regular Institution',
+    'triangle': 'Data Provider',
+}
+
+# Base marker areas (points^2) per map and shape, before the proximity size scale
+MARKER_SIZES = {
+    'main': {'circle': 50, 'triangle': 60},
+    'inset': {'circle': 80, 'triangle': 100},
+}
+
+# Major partners are drawn above the other markers
+MAJOR_PARTNER_ZORDER_STEP = 1
+
+MARKER_EDGE = {'edgecolors': 'black', 'linewidths': 0.5, 'alpha': 0.9}
+
+LABEL_BOX = {'boxstyle': "round,pad=0.3", 'fc': "white", 'ec': "gray", 'alpha': 0.9, 'mutation_scale': 0.5}
+
+LEADER_LINE = {'colors': 'gray', 'linewidths': 0.8, 'alpha': 0.6}
+
+
+def point_styles(data, palette, sizes, zorder=1, size_scale=None):
+    """Per-point colour, marker, size and zorder arrays (aligned with data's rows)."""
+    from matplotlib.colors import to_rgba_array
+
+    names = list(palette)
+    codes = np.asarray(data['FocusType'].map({name: i for i, name in enumerate(names)}).fillna(-1), dtype=int)
+    colors = to_rgba_array([palette[name] for name in names] + ['gray'])[codes]
+
+    shapes = data['Shape'].to_numpy()
+    markers = np.array([SHAPE_MARKERS.get(shape, 'o') for shape in shapes])
+    size = np.array([sizes.get(shape, sizes['circle']) for shape in shapes], dtype=float)
+    if size_scale is not None:
+        size = size * np.asarray(size_scale, dtype=float)
+
+    major = data['is_major_partner'].to_numpy(dtype=bool) if 'is_major_partner' in data.columns else False
+    zorders = np.where(major, zorder + MAJOR_PARTNER_ZORDER_STEP, zorder)
+    return {'colors': colors, 'markers': markers, 'sizes': size, 'zorders': zorders}
+
+
+def _marker_paths(markers):
+    from matplotlib.markers import MarkerStyle
+
+    paths = {}
+    for marker in np.unique(markers):
+        style = MarkerStyle(marker)
+        paths[marker] = style.get_path().transformed(style.get_transform())
+    return [paths[marker] for marker in markers]
+
+
+def draw_points(ax, x, y, styles, **kwargs):
+    """Draw styled points with one PathCollection per zorder level; returns the collections."""
+    from matplotlib.collections import PathCollection
+    from matplotlib.transforms import IdentityTransform
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    kwargs = dict(MARKER_EDGE, **kwargs)
+    collections = []
+    for level in np.unique(styles['zorders']):
+        rows = np.flatnonzero(styles['zorders'] == level)
+        collection = PathCollection(_marker_paths(styles['markers'][rows]), sizes=styles['sizes'][rows],
+                                    facecolors=styles['colors'][rows], offsets=np.column_stack([x[rows], y[rows]]),
+                                    offset_transform=ax.transData, zorder=level, **kwargs)
+        # Marker paths are in points (scaled by sizes), placed at data offsets, as in scatter
+        collection.set_transform(IdentityTransform())
+        ax.add_collection(collection)
+        collections.append(collection)
+    ax.autoscale_view()
+    return collections
+
+
+def draw_labels(ax, labeled, fontsize, boxed=True, zorder=None, **text_kwargs):
+    """Label text at label_x/label_y with leader lines to plot_x/plot_y.
+
+    Boxed labels get a white callout box and one LineCollection of leader
+    lines; drafts (boxed=False) draw the text alone.
+    """
+    from matplotlib.collections import LineCollection
+
+    if len(labeled) == 0:
+        return None
+    label_x = labeled['label_x'].to_numpy(dtype=float)
+    label_y = labeled['label_y'].to_numpy(dtype=float)
+    if zorder is not None:
+        text_kwargs['zorder'] = zorder
+    for x, y, name in zip(label_x, label_y, labeled['Institution']):
+        ax.text(x, y, name, fontsize=fontsize, bbox=dict(LABEL_BOX) if boxed else None, **text_kwargs)
+    if not boxed:
+        return None
+
+    segments = np.stack([
+        np.column_stack([labeled['plot_x'].to_numpy(dtype=float), labeled['plot_y'].to_numpy(dtype=float)]),
+        np.column_stack([label_x, label_y]),
+    ], axis=1)
+    # Just below the label text (text artists default to zorder 3)
+    leaders = LineCollection(segments, zorder=(3 if zorder is None else zorder) - 0.5, **LEADER_LINE)
+    ax.add_collection(leaders, autolim=False)
+    return leaders
+
+
+def legend_handles(palette, shapes=True):
+    """Legend entries for the focus-area colours and, unless shapes is False, the marker shapes."""
+    import matplotlib.lines as mlines
+    import matplotlib.patches as mpatches
+
+    handles = [mpatches.Patch(color=color, label=focus_type) for focus_type, color in palette.items()]
+    # Empty row for spacing
+    handles.append(mlines.Line2D([0], [0], color='none', label=' '))
+    if shapes:
+        handles.extend(mlines.Line2D([], [], color='gray', marker=SHAPE_MARKERS[shape], linestyle='None',
+                                     markersize=6, label=label) for shape, label in SHAPE_LABELS.items())
+    return handles
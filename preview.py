@@ -0,0 +1,161 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Draft previews for layout iteration.
+#
+# In draft mode the map builders trade quality for speed: country boundaries
+# are simplified, inset basemaps come from the few low-zoom tiles the draft
+# resolution needs (or the static basemap when those cannot be fetched), labels are drawn as plain text at
+# their usual positions without callout boxes and arrows, and every figure is
+# drawn once and saved as a low-resolution PNG named <output>_draft.png.
+#
+# start_refinement() then re-runs the same command at publication quality in a
+# background process. It renders into a staging directory inside the output
+# directory and, once everything is written, moves the final files into place
+# and removes the drafts, so readers never see a half-written set of outputs.
+# The staging directory lists the outputs the draft run wrote; unless the
+# background run succeeded and wrote every one of them, nothing is published
+# and the drafts stay.
+
+# Render every figure as a draft (set from --draft)
+draft = False
+
+DRAFT_DPI = 72
+
+DRAFT_SUFFIX = '_draft'
+
+# Boundary simplification tolerance of draft maps in degrees (about 5 km)
+DRAFT_TOLERANCE = 0.05
+
+REFINE_LOG = 'refine.log'
+
+# Outputs the refinement has to produce, one name per line, in the staging directory
+EXPECTED_LIST = '.expected'
+
+# Names of the outputs drafted by this process (recorded by save_figure)
+drafted = []
+
+
+def is_draft(value=None):
+    return draft if value is None else value
+
+
+def simplified(frame, tolerance=DRAFT_TOLERANCE):
+    """Copy of a GeoDataFrame with simplified geometries."""
+    if frame is None:
+        return None
+    frame = frame.copy()
+    frame['geometry'] = frame.geometry.simplify(tolerance, preserve_topology=True)
+    return frame
+
+
+def draw_boundaries(ax, frame, zorder=None, **style):
+    """Draw a GeoDataFrame's polygons as one PatchCollection.
+
+    GeoDataFrame.plot redraws the whole figure after every call; drafts add the
+    patches directly, with the same aspect correction for lon/lat data.
+    """
+    import numpy as np
+    from matplotlib.collections import PatchCollection
+    from shapely.plotting import patch_from_polygon
+
+    geometries = frame.geometry[~(frame.geometry.is_empty | frame.geometry.isna())]
+    collection = PatchCollection([patch_from_polygon(geometry) for geometry in geometries], **style)
+    if zorder is not None:
+        collection.set_zorder(zorder)
+    ax.add_collection(collection, autolim=True)
+    ax.autoscale_view()
+    if frame.crs is not None and frame.crs.is_geographic:
+        bounds = frame.total_bounds
+        ax.set_aspect(1 / np.cos(np.radians(np.mean([bounds[1], bounds[3]]))))
+    return collection
+
+
+def draft_name(name):
+    return f"{name}{DRAFT_SUFFIX}"
+
+
+def refinement_argv(argv, staging_dir, output_dir):
+    """argv for re-running a draft command at full quality into staging_dir, published to output_dir."""
+    child = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in ('--draft', '--refine'):
+            continue
+        elif arg == '--output-dir':
+            skip = True
+        elif not arg.startswith('--output-dir='):
+            child.append(arg)
+    return ['--output-dir', staging_dir, '--publish-to', output_dir] + child
+
+
+def start_refinement(argv, output_dir, expected=None):
+    """Re-run the command given by argv at publication quality in the background.
+
+    expected names the outputs the run has to write before anything is
+    published (default: every output drafted so far). Output of the background
+    run goes to <output_dir>/refine.log. Returns the process, which keeps
+    running after this one exits.
+    """
+    staging_dir = tempfile.mkdtemp(prefix='.refine-', dir=output_dir)
+    with open(os.path.join(staging_dir, EXPECTED_LIST), 'w', encoding='utf-8') as f:
+        f.writelines(f"{name}\n" for name in (drafted if expected is None else expected))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create_map.py')
+    with open(os.path.join(output_dir, REFINE_LOG), 'w', encoding='utf-8') as log:
+        process = subprocess.Popen([sys.executable, script] + refinement_argv(argv, staging_dir, output_dir),
+                                   stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    print(f"Refining to publication quality in the background (pid {process.pid}, "
+          f"log {os.path.join(output_dir, REFINE_LOG)})")
+    return process
+
+
+def missing_outputs(staging_dir):
+    """Expected outputs of a refinement that have no file in staging_dir."""
+    try:
+        with open(os.path.join(staging_dir, EXPECTED_LIST), encoding='utf-8') as f:
+            expected = [line.strip() for line in f if line.strip()]
+    except OSError:
+        return [EXPECTED_LIST]
+    stems = {os.path.splitext(name)[0] for name in os.listdir(staging_dir)}
+    return [name for name in expected if name not in stems]
+
+
+def discard(staging_dir, reason):
+    """Remove a refinement's staging directory, keeping the drafts it would have replaced."""
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    print(f"Refinement failed ({reason}); keeping the drafts")
+
+
+def publish(staging_dir, output_dir):
+    """Move every file written to staging_dir into output_dir and remove the drafts they replace.
+
+    Nothing is published unless every expected output was written.
+    """
+    missing = missing_outputs(staging_dir)
+    if missing:
+        discard(staging_dir, f"missing {', '.join(missing)}")
+        return []
+
+    published = []
+    for name in sorted(os.listdir(staging_dir)):
+        if name == EXPECTED_LIST:
+            continue
+        os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+        published.append(name)
+    os.remove(os.path.join(staging_dir, EXPECTED_LIST))
+
+    stems = {os.path.splitext(name)[0] for name in published}
+    removed = 0
+    for name in os.listdir(output_dir):
+        stem, _ = os.path.splitext(name)
+        if stem.endswith(DRAFT_SUFFIX) and stem[:-len(DRAFT_SUFFIX)] in stems:
+            os.remove(os.path.join(output_dir, name))
+            removed += 1
+    os.rmdir(staging_dir)
+    print(f"Published {len(published)} files to {output_dir}, replacing {removed} drafts")
+    return published
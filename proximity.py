@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+# Great-circle proximity analytics over partner locations.
+#
+# Points are placed on the unit sphere and indexed with a KD-tree. The straight
+# chord between two points on a sphere grows monotonically with their
+# great-circle distance, so nearest-neighbour and radius queries on the chord
+# give exact haversine answers. All queries run in bulk over whole columns.
+#
+# Nothing here runs on load: the proximity command, the layer bundle, the
+# charts and the marker sizes each compute what they use.
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Roles counted as research capacity when measuring distance to the nearest one
+SUPPORT_ROLES = ['Research', 'Data_Providers']
+
+# Radius of the local partner counts that scale the map markers (metro scale)
+NEIGHBOUR_RADIUS_KM = 10
+
+# Number of nearest partners listed per institution
+NEAREST_COUNT = 3
+
+
+def unit_vectors(lon, lat):
+    """(n, 3) points on the unit sphere for lon/lat in degrees."""
+    lon = np.radians(np.asarray(lon, dtype=float))
+    lat = np.radians(np.asarray(lat, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float) / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """Great-circle distance in km, element-wise."""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=float)) for v in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class PartnerIndex:
+    """Spatial index over lon/lat points; rows without coordinates are left out."""
+
+    def __init__(self, lon, lat):
+        from scipy.spatial import cKDTree
+
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        self.rows = np.flatnonzero(~(np.isnan(lon) | np.isnan(lat)))
+        self.tree = cKDTree(unit_vectors(lon[self.rows], lat[self.rows]), balanced_tree=False, compact_nodes=False)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def nearest(self, lon, lat, k=1, exclude=None):
+        """Distances (km) and row numbers of the k nearest points to each query, shape (n, k).
+
+        exclude gives, per query, a row number that must not be returned (usually
+        the query's own row). Missing neighbours are NaN and -1.
+        """
+        n = len(np.atleast_1d(lon))
+        distances = np.full((n, k), np.nan)
+        rows = np.full((n, k), -1)
+        valid = ~(np.isnan(np.asarray(lon, dtype=float)) | np.isnan(np.asarray(lat, dtype=float)))
+        extra = 0 if exclude is None else 1
+        wanted = min(k + extra, len(self))
+        if wanted - extra <= 0 or not valid.any():
+            return distances, rows
+
+        chord, found = self.tree.query(unit_vectors(np.asarray(lon)[valid], np.asarray(lat)[valid]), k=wanted)
+        chord, found = chord.reshape(-1, wanted), found.reshape(-1, wanted)
+        found_rows = self.rows[found]
+
+        if exclude is not None:
+            # Drop the excluded row, or the farthest hit when the excluded row was not among them
+            keep = found_rows != np.asarray(exclude)[valid][:, None]
+            keep[keep.all(axis=1), -1] = False
+            taken = min(k, wanted - 1)
+            chord = chord[keep].reshape(-1, wanted - 1)[:, :taken]
+            found_rows = found_rows[keep].reshape(-1, wanted - 1)[:, :taken]
+        else:
+            taken = wanted
+
+        distances[valid, :taken] = chord_to_km(chord)
+        rows[valid, :taken] = found_rows
+        return distances, rows
+
+    def count_within(self, lon, lat, radius_km):
+        """Number of indexed points within radius_km of each query point (itself included)."""
+        counts = np.zeros(len(np.atleast_1d(lon)), dtype=int)
+        valid = ~(np.isnan(np.asarray(lon, dtype=float)) | np.isnan(np.asarray(lat, dtype=float)))
+        if len(self) and valid.any():
+            counts[valid] = self.tree.query_ball_point(unit_vectors(np.asarray(lon)[valid], np.asarray(lat)[valid]),
+                                                       km_to_chord(radius_km), return_length=True)
+        return counts
+
+
+def add_proximity_columns(data, k=NEAREST_COUNT, radius_km=NEIGHBOUR_RADIUS_KM, support_roles=SUPPORT_ROLES):
+    """Add nearest-partner and neighbourhood columns to the data.
+
+    nearest_partners        names of the k nearest other institutions, ';'-separated
+    nearest_partner_km      distance to the nearest other institution
+    nearest_support_km      distance to the nearest other Research or Data_Providers partner
+    nearby_partners         other institutions within radius_km
+    """
+    data = data.copy()
+    lon = data['lon'].to_numpy(dtype=float)
+    lat = data['lat'].to_numpy(dtype=float)
+    own_rows = np.arange(len(data))
+
+    index = PartnerIndex(lon, lat)
+    distances, rows = index.nearest(lon, lat, k=k, exclude=own_rows)
+    names = pd.DataFrame(np.append(data['Institution'].astype(str).to_numpy(), '')[rows], index=data.index)
+    joined = names[0]
+    for column in names.columns[1:]:
+        joined = joined + ';' + names[column]
+    data['nearest_partners'] = joined.str.strip(';')
+    data['nearest_partner_km'] = distances[:, 0]
+
+    roles = [role for role in support_roles if role in data.columns]
+    support = (data[roles] == 1).any(axis=1).to_numpy() if roles else np.zeros(len(data), dtype=bool)
+    support_rows = np.flatnonzero(support)
+    support_index = PartnerIndex(lon[support_rows], lat[support_rows])
+    # Each support partner's own position in the support index is excluded
+    position = np.full(len(data), -2)
+    position[support_rows] = np.arange(len(support_rows))
+    support_distances, _ = support_index.nearest(lon, lat, k=1, exclude=position)
+    data['nearest_support_km'] = support_distances[:, 0]
+
+    data['nearby_partners'] = np.maximum(index.count_within(lon, lat, radius_km) - 1, 0)
+    return data
+
+
+def nearby_partner_counts(data, among=None, radius_km=NEIGHBOUR_RADIUS_KM):
+    """Other institutions of among (default: data itself) within radius_km of each row of data.
+
+    among must contain data's rows, which are not counted as their own neighbours.
+    """
+    among = data if among is None else among
+    index = PartnerIndex(among['lon'].to_numpy(dtype=float), among['lat'].to_numpy(dtype=float))
+    counts = index.count_within(data['lon'].to_numpy(dtype=float), data['lat'].to_numpy(dtype=float), radius_km)
+    return np.maximum(counts - 1, 0)
+
+
+def city_coverage(data):
+    """Per city: institutions, centroid, and median and maximum distance (km) of its institutions
+    from the centroid, i.e. the radius the city's partners cover."""
+    located = data.dropna(subset=['lon', 'lat', 'Country', 'City'])
+    xyz = unit_vectors(located['lon'], located['lat'])
+    keys = [located['Country'].to_numpy(), located['City'].to_numpy()]
+    sums = pd.DataFrame(xyz, columns=['x', 'y', 'z']).groupby(keys).transform('sum').to_numpy()
+
+    # Spherical centroid: the normalised mean of the unit vectors
+    centroid = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+    centroid_lon = np.degrees(np.arctan2(centroid[:, 1], centroid[:, 0]))
+    centroid_lat = np.degrees(np.arcsin(np.clip(centroid[:, 2], -1, 1)))
+    distance = chord_to_km(np.linalg.norm(xyz - centroid, axis=1))
+
+    per_row = pd.DataFrame({'Country': keys[0], 'City': keys[1], 'lon': centroid_lon, 'lat': centroid_lat,
+                            'distance_km': distance})
+    coverage = per_row.groupby(['Country', 'City']).agg(
+        institutions=('distance_km', 'size'), lon=('lon', 'first'), lat=('lat', 'first'),
+        median_km=('distance_km', 'median'), coverage_km=('distance_km', 'max'))
+    return coverage.reset_index().sort_values('institutions', ascending=False, ignore_index=True)
+
+
+def marker_scale(data, low=0.8, high=1.6, among=None):
+    """Marker size factor per row, growing with the number of partners nearby.
+
+    Uses the nearby_partners column when present, otherwise counts the
+    institutions of among (default: data) around each row.
+    """
+    if len(data) == 0:
+        return np.ones(0)
+    if 'nearby_partners' in data.columns:
+        nearby = data['nearby_partners'].to_numpy(dtype=float)
+    else:
+        nearby = nearby_partner_counts(data, among)
+    nearby = np.log1p(nearby.astype(float))
+    top = nearby.max()
+    return low + (high - low) * (nearby / top if top > 0 else 0)
@@ -2,8 +2,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Load the data
-df = pd.read_csv('base.csv', sep=';')
+from proximity import add_proximity_columns, city_coverage
 
 # Define custom colors
 colors = {
@@ -17,50 +16,91 @@ colors = {
 southern_africa_countries = ['South Africa', 'Zimbabwe', 'Mozambique', 'Botswana', 
                             'Namibia', 'Lesotho', 'Eswatini', 'Malawi', 'Zambia', 'Angola']
 
-# Filter for Southern Africa
-southern_africa_df = df[df['Country'].isin(southern_africa_countries)]
+# Cities counted as Gauteng (Johannesburg and Pretoria)
+gauteng_cities = ['Johannesburg', 'Pretoria', 'Soweto']
 
-# Filter for Gauteng (Johannesburg and Pretoria)
-gauteng_df = df[(df['City'] == 'Johannesburg') | (df['City'] == 'Pretoria') | 
-                (df['City'] == 'Soweto')]
+# Count organizations in each category
+def category_counts(dataframe):
+    return [dataframe['Policy'].sum(),
+            dataframe['Research'].sum(),
+            dataframe['Engagement, Advocacy, and Capacity Building'].sum(),
+            dataframe['Finance_programmes'].sum()]
 
-# Function to create visualizations for a given dataframe and title
-def create_visualizations(dataframe, region_name):
-    # Count organizations in each category
-    policy_count = dataframe['Policy'].sum()
-    research_count = dataframe['Research'].sum()
-    engagement_count = dataframe['Engagement, Advocacy, and Capacity Building'].sum()
-    finance_count = dataframe['Finance_programmes'].sum()
-    
-    # Create bar chart
-    categories = ['Policy', 'Research', 'Engagement & Advocacy', 'Finance & Programmes']
-    counts = [policy_count, research_count, engagement_count, finance_count]
+categories = ['Policy', 'Research', 'Engagement & Advocacy', 'Finance & Programmes']
+
+# Create bar chart of organizations per category
+def create_bar_chart(dataframe, region_name):
+    counts = category_counts(dataframe)
     category_colors = [colors[cat] for cat in categories]
     
-    plt.figure(figsize=(10, 6))
-    bars = plt.bar(categories, counts, color=category_colors)
-    plt.title(f'Distribution of Organizations in {region_name} by Category', fontsize=16)
-    plt.ylabel('Number of Organizations', fontsize=14)
-    plt.xticks(fontsize=12)
-    plt.yticks(fontsize=12)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    bars = ax.bar(categories, counts, color=category_colors)
+    ax.set_title(f'Distribution of Organizations in {region_name} by Category', fontsize=16)
+    ax.set_ylabel('Number of Organizations', fontsize=14)
+    ax.tick_params(labelsize=12)
     
     # Add count labels on top of bars
     for bar in bars:
         height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.5,
-                 f'{int(height)}', ha='center', fontsize=12)
+        ax.text(bar.get_x() + bar.get_width()/2., height + 0.5,
+                f'{int(height)}', ha='center', fontsize=12)
     
-    plt.tight_layout()
+    fig.tight_layout()
+    return fig
+
+# Create a pie chart showing the percentage of organizations in each category
+def create_pie_chart(dataframe, region_name):
+    counts = category_counts(dataframe)
+    category_colors = [colors[cat] for cat in categories]
+    
+    fig, ax = plt.subplots(figsize=(10, 8))
+    ax.pie(counts, labels=categories, autopct='%1.1f%%', startangle=90, 
+           colors=category_colors)
+    ax.set_title(f'Percentage of Organizations in {region_name} by Category', fontsize=16)
+    ax.axis('equal')
+    fig.tight_layout()
+    return fig
+
+# Create a bar chart of organizations per city
+def create_city_chart(dataframe, region_name):
+    city_counts = dataframe['City'].value_counts()
+    fig, ax = plt.subplots(figsize=(12, 8))
+    ax.bar(city_counts.index, city_counts.values, color='#4472C4')
+    ax.set_title(f'Number of Organizations by City in {region_name}', fontsize=16)
+    ax.set_ylabel('Number of Organizations', fontsize=14)
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right', fontsize=10)
+    fig.tight_layout()
+    return fig
+
+# Create a bar chart of how far each city's partners spread and how far they are from research capacity
+def create_coverage_chart(dataframe, region_name, top_n=15):
+    coverage = city_coverage(dataframe).head(top_n)
+    support = add_proximity_columns(dataframe).groupby(['Country', 'City'])['nearest_support_km'].median()
+    coverage['support_km'] = support.reindex(pd.MultiIndex.from_frame(coverage[['Country', 'City']])).to_numpy()
+    
+    positions = np.arange(len(coverage))
+    fig, ax = plt.subplots(figsize=(12, 8))
+    ax.barh(positions - 0.2, coverage['coverage_km'], height=0.4, color='#4472C4', label='Coverage radius')
+    ax.barh(positions + 0.2, coverage['support_km'], height=0.4, color=colors['Research'],
+            label='Median distance to nearest Research or Data Provider partner')
+    ax.set_yticks(positions)
+    ax.set_yticklabels([f"{city} ({n})" for city, n in zip(coverage['City'], coverage['institutions'])])
+    ax.invert_yaxis()
+    ax.set_xlabel('Distance (km)', fontsize=14)
+    ax.set_title(f'Partner Coverage by City in {region_name}', fontsize=16)
+    ax.legend(fontsize=10)
+    fig.tight_layout()
+    return fig
+
+# Function to create visualizations for a given dataframe and title
+def create_visualizations(dataframe, region_name):
+    policy_count, research_count, engagement_count, finance_count = category_counts(dataframe)
+    
+    create_bar_chart(dataframe, region_name)
     plt.savefig(f'{region_name.lower().replace(" ", "_")}_distribution.png')
     plt.show()
     
-    # Create a pie chart showing the percentage of organizations in each category
-    plt.figure(figsize=(10, 8))
-    plt.pie(counts, labels=categories, autopct='%1.1f%%', startangle=90, 
-            colors=category_colors)
-    plt.title(f'Percentage of Organizations in {region_name} by Category', fontsize=16)
-    plt.axis('equal')
-    plt.tight_layout()
+    create_pie_chart(dataframe, region_name)
     plt.savefig(f'{region_name.lower().replace(" ", "_")}_percentage.png')
     plt.show()
     
@@ -72,23 +112,39 @@ def create_visualizations(dataframe, region_name):
     print(f"Organizations with Engagement role: {engagement_count} ({engagement_count/len(dataframe)*100:.1f}%)")
     print(f"Organizations with Finance role: {finance_count} ({finance_count/len(dataframe)*100:.1f}%)")
     
+    # Distances between partners
+    proximity = add_proximity_columns(dataframe)
+    print(f"Median distance to nearest partner: {proximity['nearest_partner_km'].median():.1f} km")
+    print(f"Median distance to nearest Research or Data Provider partner: "
+          f"{proximity['nearest_support_km'].median():.1f} km")
+    print(f"Organizations over 100 km from any Research or Data Provider partner: "
+          f"{(proximity['nearest_support_km'] > 100).sum()}")
+    
     # Create a table of organizations by city
     if region_name == "Southern Africa":
-        city_counts = dataframe['City'].value_counts()
-        plt.figure(figsize=(12, 8))
-        plt.bar(city_counts.index, city_counts.values, color='#4472C4')
-        plt.title('Number of Organizations by City in Southern Africa', fontsize=16)
-        plt.ylabel('Number of Organizations', fontsize=14)
-        plt.xticks(rotation=45, ha='right', fontsize=10)
-        plt.tight_layout()
+        create_city_chart(dataframe, region_name)
         plt.savefig('southern_africa_cities.png')
         plt.show()
+        
+        create_coverage_chart(dataframe, region_name)
+        plt.savefig('southern_africa_coverage.png')
+        plt.show()
 
-# Create visualizations for Southern Africa
-create_visualizations(southern_africa_df, "Southern Africa")
-
-# Create visualizations for Gauteng
-create_visualizations(gauteng_df, "Gauteng")
+if __name__ == "__main__":
+    # Load the data
+    df = pd.read_csv('base.csv', sep=';')
+    
+    # Filter for Southern Africa
+    southern_africa_df = df[df['Country'].isin(southern_africa_countries)]
+    
+    # Filter for Gauteng (Johannesburg and Pretoria)
+    gauteng_df = df[df['City'].isin(gauteng_cities)]
+    
+    # Create visualizations for Southern Africa
+    create_visualizations(southern_africa_df, "Southern Africa")
+    
+    # Create visualizations for Gauteng
+    create_visualizations(gauteng_df, "Gauteng")
 
 # Create a map of Southern African partners (if coordinates are available)
 # This requires additional libraries like geopandas and contextily
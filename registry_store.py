@@ -0,0 +1,154 @@
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+# Indexed SQLite copy of the partner registry.
+#
+# The registry is written once per data change into a single .sqlite file with
+# B-tree indexes on Country, City and every role/programme flag, plus an R-tree
+# on lon/lat, so subsets ("Gauteng Data_Providers in HEAT doing Research") are
+# index lookups instead of full scans. RegistryStore.query() returns a plain
+# DataFrame in the same shape as base.csv, which prepare_map_data() in
+# create_map.py turns into map-ready data.
+
+SCHEMA_VERSION = 1
+
+ROLE_COLUMNS = [
+    'Official Partners', 'Funder', 'Partners', 'Data_Providers', 'Government Partners',
+    'Policy', 'Research', 'Engagement, Advocacy, and Capacity Building', 'Finance_programmes'
+]
+
+PROGRAMME_COLUMNS = ['CHAMNHA', 'HEAT', 'ENBEL', 'GHAP', 'HAPI', 'BioHEAT', 'HIGH_Horizons']
+
+TABLE = 'registry'
+RTREE = 'registry_rtree'
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _index_name(column):
+    return 'ix_' + ''.join(ch if ch.isalnum() else '_' for ch in column.lower())
+
+
+def source_stamp(source_path):
+    """Identity of a source file's current version, as stored in the meta of derived files."""
+    stat = os.stat(source_path)
+    return {'source': os.path.abspath(source_path), 'mtime_ns': str(stat.st_mtime_ns),
+            'size': str(stat.st_size)}
+
+
+def _store_stamp(source_path):
+    return dict(source_stamp(source_path), schema_version=str(SCHEMA_VERSION))
+
+
+def write_registry_store(data, db_path, source_path=None):
+    """Replace the store at db_path with the registry rows in data."""
+    tmp_path = f"{db_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    rows = data.reset_index(drop=True)
+    rows.insert(0, 'row_id', range(1, len(rows) + 1))
+    if 'geometry' in rows.columns:
+        rows = pd.DataFrame(rows.drop(columns='geometry'))
+
+    # The connection is closed (not just committed) before the file is moved into place
+    with closing(sqlite3.connect(tmp_path)) as conn, conn:
+        rows.to_sql(TABLE, conn, index=False, dtype={'row_id': 'INTEGER PRIMARY KEY'})
+
+        indexed = ['Country', 'City'] + [c for c in ROLE_COLUMNS + PROGRAMME_COLUMNS if c in rows.columns]
+        for column in indexed:
+            conn.execute(f"CREATE INDEX {_index_name(column)} ON {TABLE} ({_quote(column)})")
+        conn.execute(f"CREATE INDEX ix_country_city ON {TABLE} (Country, City)")
+
+        conn.execute(f"CREATE VIRTUAL TABLE {RTREE} USING rtree(id, min_lon, max_lon, min_lat, max_lat)")
+        conn.execute(f"INSERT INTO {RTREE} SELECT row_id, lon, lon, lat, lat FROM {TABLE} "
+                     "WHERE lon IS NOT NULL AND lat IS NOT NULL")
+
+        meta = _store_stamp(source_path) if source_path else {'schema_version': str(SCHEMA_VERSION)}
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        conn.execute("ANALYZE")
+    os.replace(tmp_path, db_path)
+    print(f"Wrote {len(rows)} registry rows to {db_path}")
+
+
+def store_is_current(db_path, source_path):
+    """True if db_path was built from the current version of source_path."""
+    if not os.path.exists(db_path):
+        return False
+    try:
+        with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error:
+        return False
+    return meta == _store_stamp(source_path)
+
+
+class RegistryStore:
+    """Read-only filter queries against a registry store."""
+
+    def __init__(self, db_path):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({TABLE})")]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _flag(self, name):
+        # Flags are matched case-insensitively against the real column names
+        for column in ROLE_COLUMNS + PROGRAMME_COLUMNS:
+            if column.lower() == name.lower() and column in self.columns:
+                return column
+        raise ValueError(f"Unknown role or programme {name!r}")
+
+    def query(self, country=None, city=None, roles=(), programmes=(), bbox=None, columns=None):
+        """Registry rows matching every given filter, as a DataFrame.
+
+        country and city take a name or a list of names; roles and programmes
+        are flag columns that must be 1; bbox is [xmin, xmax, ymin, ymax].
+        """
+        where, params = [], []
+        for column, value in (('Country', country), ('City', city)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        for name in list(roles) + list(programmes):
+            where.append(f"{_quote(self._flag(name))} = 1")
+        if bbox is not None:
+            xmin, xmax, ymin, ymax = bbox
+            where.append(f"row_id IN (SELECT id FROM {RTREE} WHERE min_lon >= ? AND max_lon <= ? "
+                         "AND min_lat >= ? AND max_lat <= ?)")
+            params.extend([xmin, xmax, ymin, ymax])
+
+        if columns is None:
+            selected = ', '.join(_quote(c) for c in self.columns if c != 'row_id')
+        else:
+            unknown = [c for c in columns if c not in self.columns]
+            if unknown:
+                raise ValueError(f"Unknown columns {unknown}")
+            selected = ', '.join(_quote(c) for c in columns)
+
+        sql = f"SELECT {selected} FROM {TABLE}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY row_id"
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def count(self, **filters):
+        return len(self.query(columns=['Institution'], **filters))
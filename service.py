@@ -0,0 +1,331 @@
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import matplotlib
+matplotlib.use('Agg')
+
+import create_map
+from insets import discover_insets
+from registry_store import PROGRAMME_COLUMNS
+
+# Local HTTP render service.
+#
+# Keeps the registry and boundaries loaded and renders maps or representation
+# charts from query parameters, e.g.
+#
+#   /map?bbox=27.5,28.7,-26.5,-25.4&title=Gauteng&dpi=120
+#   /map?programme=HEAT,ENBEL&boxes=1&format=pdf
+#   /chart?kind=pie&region=gauteng
+#
+# Parameters are normalized into a cache key and the rendered bytes are kept in
+# an LRU bounded by total size, so repeated requests are answered from memory.
+# Keys include the stamp of the base.csv they were rendered from, and the cache
+# is dropped whenever base.csv changes on disk.
+
+CONTENT_TYPES = {'png': 'image/png', 'pdf': 'application/pdf'}
+
+MIN_DPI, MAX_DPI = 30, 600
+
+
+class DataUnavailable(Exception):
+    """The registry file is missing or could not be loaded."""
+
+
+class RenderCache:
+    """LRU of rendered outputs bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, record=True):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += record
+                return None
+            self._entries.move_to_end(key)
+            self.hits += record
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            if len(body) > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def _single(query, name, default=None):
+    values = query.get(name)
+    return values[-1].strip() if values else default
+
+
+def _parse_bbox(text):
+    try:
+        bbox = [round(float(v), 6) for v in text.split(',')]
+    except ValueError:
+        raise ValueError(f"bbox must be four numbers xmin,xmax,ymin,ymax, got {text!r}")
+    if len(bbox) != 4 or bbox[0] >= bbox[1] or bbox[2] >= bbox[3]:
+        raise ValueError(f"bbox must be xmin,xmax,ymin,ymax with min < max, got {text!r}")
+    return tuple(bbox)
+
+
+def _parse_programmes(text):
+    if not text:
+        return ()
+    lookup = {col.lower(): col for col in PROGRAMME_COLUMNS}
+    programmes = set()
+    for name in text.split(','):
+        name = name.strip().lower()
+        if name not in lookup:
+            raise ValueError(f"Unknown programme {name!r}; choose from {', '.join(PROGRAMME_COLUMNS)}")
+        programmes.add(lookup[name])
+    return tuple(sorted(programmes))
+
+
+def normalize_params(path, query):
+    """Validated, canonical parameters for a request; equal requests give equal keys."""
+    fmt = _single(query, 'format', 'png').lower()
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"format must be png or pdf, got {fmt!r}")
+    try:
+        dpi = int(_single(query, 'dpi', '150'))
+    except ValueError:
+        raise ValueError("dpi must be an integer")
+    if not MIN_DPI <= dpi <= MAX_DPI:
+        raise ValueError(f"dpi must be between {MIN_DPI} and {MAX_DPI}")
+
+    params = {'format': fmt, 'dpi': dpi,
+              'programme': _parse_programmes(_single(query, 'programme'))}
+
+    if path == '/map':
+        kind = _single(query, 'kind', 'main').lower()
+        if kind not in ('main', 'inset'):
+            raise ValueError(f"kind must be main or inset, got {kind!r}")
+        bbox = _single(query, 'bbox')
+        params['kind'] = kind
+        params['bbox'] = _parse_bbox(bbox) if bbox else None
+        if kind == 'inset':
+            if params['bbox'] is None:
+                raise ValueError("inset maps need a bbox")
+            params['title'] = _single(query, 'title', 'Custom Area')
+        else:
+            params['boxes'] = _single(query, 'boxes', '0').lower() in ('1', 'true', 'yes')
+    elif path == '/chart':
+        kind = _single(query, 'kind', 'bar').lower()
+        region = _single(query, 'region', 'southern_africa').lower()
+        if kind not in ('bar', 'pie', 'city', 'coverage'):
+            raise ValueError(f"kind must be bar, pie, city or coverage, got {kind!r}")
+        if region not in ('southern_africa', 'gauteng'):
+            raise ValueError(f"region must be southern_africa or gauteng, got {region!r}")
+        params['kind'] = kind
+        params['region'] = region
+    else:
+        raise LookupError(path)
+
+    return (path,) + tuple(sorted(params.items()))
+
+
+class RenderService:
+    """Loaded data plus the render cache; render() is safe to call from many threads."""
+
+    def __init__(self, data_path, gazetteer_file=None, cache_bytes=256 * 1024 * 1024,
+                 tile_providers=None):
+        self.data_path = data_path
+        self.gazetteer_file = gazetteer_file
+        self.tile_providers = tile_providers
+        self.cache = RenderCache(cache_bytes)
+        self._render_lock = threading.Lock()
+        self._data_lock = threading.Lock()
+        self._stamp = None
+        self.data = None
+        self.africa = None
+        self.southern_africa = None
+        self.insets = []
+
+    def _ensure_loaded(self):
+        """Reload when base.csv changed on disk; returns the stamp, data and insets to render from."""
+        with self._data_lock:
+            try:
+                stat = os.stat(self.data_path)
+            except OSError as e:
+                raise DataUnavailable(f"Registry {self.data_path} is not readable: {e.strerror}") from e
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp:
+                return self._stamp, self.data, self.insets
+            data = create_map.load_data(self.data_path, self.gazetteer_file)
+            if data is None:
+                raise DataUnavailable(f"Could not load {self.data_path}")
+            if self.africa is None:
+                _, self.africa, self.southern_africa = create_map.load_map_data()
+            self.data = data
+            self.insets = discover_insets(data)
+            self._stamp = stamp
+            # Earlier renders are stale; renders still running on the old data are keyed
+            # on the old stamp, so they can no longer be served
+            self.cache.clear()
+            return self._stamp, self.data, self.insets
+
+    def is_current(self, stamp):
+        with self._data_lock:
+            return stamp == self._stamp
+
+    @staticmethod
+    def _subset(data, programmes):
+        if not programmes:
+            return data
+        return data[(data[list(programmes)] == 1).any(axis=1)]
+
+    def _draw(self, params, data, insets):
+        from regional_representation import (create_bar_chart, create_pie_chart, create_city_chart,
+                                             create_coverage_chart, gauteng_cities)
+
+        data = self._subset(data, params['programme'])
+        if params['path'] == '/chart':
+            region_name = 'Southern Africa'
+            if params['region'] == 'gauteng':
+                data = data[data['City'].isin(gauteng_cities)]
+                region_name = 'Gauteng'
+            chart = {'bar': create_bar_chart, 'pie': create_pie_chart, 'city': create_city_chart,
+                     'coverage': create_coverage_chart}
+            return chart[params['kind']](data, region_name)
+
+        if params['kind'] == 'inset':
+            fig, _ = create_map.create_inset_map(data, list(params['bbox']), params['title'],
+                                                 tile_providers=self.tile_providers)
+            return fig
+
+        # Labels are only placed inside the requested bbox
+        fig, _ = create_map.create_main_map(data, self.africa, self.southern_africa,
+                                            include_boxes=params['boxes'], insets=insets, extent=params['bbox'])
+        return fig
+
+    def render(self, path, query):
+        """(content type, body, cache hit) for a request path and parsed query string."""
+        request = normalize_params(path, query)
+        params = dict(request[1:], path=path)
+        stamp, data, insets = self._ensure_loaded()
+        key = (stamp,) + request
+        content_type = CONTENT_TYPES[params['format']]
+
+        body = self.cache.get(key)
+        if body is not None:
+            return content_type, body, True
+
+        # pyplot is not thread safe, so figures are drawn one at a time
+        with self._render_lock:
+            body = self.cache.get(key, record=False)
+            if body is not None:
+                return content_type, body, True
+            plt = create_map._pyplot()
+            fig = self._draw(params, data, insets)
+            buffer = io.BytesIO()
+            # Maps are saved at their figure size: with 'tight', any stray artist outside the
+            # axes would grow the image
+            fig.savefig(buffer, format=params['format'], dpi=params['dpi'],
+                        bbox_inches=None if path == '/map' else 'tight')
+            plt.close(fig)
+            body = buffer.getvalue()
+            if self.is_current(stamp):
+                self.cache.put(key, body)
+        return content_type, body, False
+
+
+class _RenderHandler(BaseHTTPRequestHandler):
+    def _send(self, status, content_type, body, extra_headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, 'application/json', json.dumps(payload).encode('utf-8'))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+
+        if url.path == '/':
+            self._send_json(200, {'endpoints': ['/map', '/chart', '/stats'],
+                                  'programmes': PROGRAMME_COLUMNS})
+            return
+        if url.path == '/stats':
+            self._send_json(200, service.cache.stats())
+            return
+
+        start = time.perf_counter()
+        try:
+            content_type, body, hit = service.render(url.path, parse_qs(url.query))
+        except LookupError:
+            self._send_json(404, {'error': f"Unknown path {url.path}"})
+            return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except DataUnavailable as e:
+            self._send_json(503, {'error': str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': f"Render failed: {e}"})
+            return
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self._send(200, content_type, body, [('X-Cache', 'hit' if hit else 'miss'),
+                                             ('X-Render-Time-Ms', f"{elapsed:.1f}")])
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}")
+
+
+def make_server(service, host='127.0.0.1', port=8765):
+    httpd = ThreadingHTTPServer((host, port), _RenderHandler)
+    httpd.service = service
+    return httpd
+
+
+def serve(data_path, gazetteer_file=None, host='127.0.0.1', port=8765, cache_mb=256):
+    service = RenderService(data_path, gazetteer_file, cache_mb * 1024 * 1024)
+    try:
+        service._ensure_loaded()
+    except DataUnavailable as e:
+        print(f"Cannot start the render service: {e}")
+        return 1
+    httpd = make_server(service, host, port)
+    print(f"Render service listening on http://{host}:{httpd.server_address[1]}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping render service")
+    finally:
+        httpd.server_close()
+    return 0
@@ -0,0 +1,188 @@
+import glob
+import hashlib
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from validation import FLAG_COLUMNS, TEXT_COLUMNS
+
+# Versioned snapshots of the registry and row-level diffs between them.
+#
+# Each ingested base.csv is stored as a Parquet file named after its ingest time
+# (to the microsecond, so names sort in ingest order) and content hash (an
+# unchanged registry is not stored twice). Diffs are keyed on Institution
+# (numbered when a name repeats) and computed with one outer merge and
+# column-wise comparisons: added and removed institutions, changed flags, other
+# changed fields, and moved coordinates.
+
+# Text fields compared between versions; Institution is left out because rows are matched on it
+DIFF_TEXT_COLUMNS = [c for c in TEXT_COLUMNS if c != 'Institution']
+
+# Coordinates closer than this (degrees) count as unchanged
+MOVE_TOLERANCE = 1e-6
+
+
+def content_hash(data):
+    """Stable hash of the registry contents, independent of the file's mtime."""
+    hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    return hashlib.sha1(hashes.tobytes() + ','.join(data.columns).encode('utf-8')).hexdigest()
+
+
+def list_snapshots(snapshot_dir):
+    """Snapshot paths, oldest first."""
+    return sorted(glob.glob(os.path.join(snapshot_dir, '*.parquet')))
+
+
+def save_snapshot(data, snapshot_dir):
+    """Store data as a new snapshot unless it matches the latest one; returns its path."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    digest = content_hash(data)[:12]
+
+    existing = list_snapshots(snapshot_dir)
+    if existing and existing[-1].endswith(f"_{digest}.parquet"):
+        print(f"Registry unchanged since snapshot {os.path.basename(existing[-1])}")
+        return existing[-1]
+
+    path = os.path.join(snapshot_dir, f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{digest}.parquet")
+    columns = [c for c in data.columns if c != 'geometry']
+    pd.DataFrame(data[columns]).to_parquet(path, index=False, compression='zstd')
+    print(f"Saved registry snapshot {path}")
+    return path
+
+
+def load_snapshot(path):
+    return pd.read_parquet(path)
+
+
+def _keyed(data):
+    # Institution plus its occurrence number, so repeated names still pair up
+    keyed = data.reset_index(drop=True).copy()
+    keyed['_occurrence'] = keyed.groupby('Institution').cumcount()
+    return keyed
+
+
+def diff_registry(old, new, flag_columns=None, text_columns=None, tolerance=MOVE_TOLERANCE):
+    """Row-level differences between two registry versions, one row per affected institution.
+
+    Columns: Institution, change ('added', 'removed' or 'changed'), changed_flags and
+    changed_fields (';'-separated column names), moved, old_lon/old_lat, new_lon/new_lat.
+    """
+    if flag_columns is None:
+        flag_columns = [c for c in FLAG_COLUMNS if c in old.columns and c in new.columns]
+    if text_columns is None:
+        text_columns = [c for c in DIFF_TEXT_COLUMNS if c in old.columns and c in new.columns]
+    compared = list(flag_columns) + list(text_columns)
+
+    left = _keyed(old)[['Institution', '_occurrence', 'lon', 'lat'] + compared]
+    right = _keyed(new)[['Institution', '_occurrence', 'lon', 'lat'] + compared]
+    merged = left.merge(right, on=['Institution', '_occurrence'], how='outer',
+                        suffixes=('_old', '_new'), indicator=True)
+
+    both = (merged['_merge'] == 'both').to_numpy()
+
+    def differs(column):
+        a, b = merged[f"{column}_old"], merged[f"{column}_new"]
+        return (a.ne(b) & ~(a.isna() & b.isna())).to_numpy() & both
+
+    def changed_names(columns):
+        if not columns:
+            return pd.Series('', index=merged.index)
+        flags = pd.DataFrame({c: differs(c) for c in columns}, index=merged.index)
+        return flags.dot(pd.Index(columns) + ';').str.rstrip(';')
+
+    old_lon, new_lon = merged['lon_old'].to_numpy(float), merged['lon_new'].to_numpy(float)
+    old_lat, new_lat = merged['lat_old'].to_numpy(float), merged['lat_new'].to_numpy(float)
+    with np.errstate(invalid='ignore'):
+        shift = np.fmax(np.abs(old_lon - new_lon), np.abs(old_lat - new_lat))
+    missing_changed = np.isnan(old_lon + old_lat) != np.isnan(new_lon + new_lat)
+    moved = both & ((shift > tolerance) | missing_changed)
+
+    diff = pd.DataFrame({
+        'Institution': merged['Institution'],
+        'change': np.select([merged['_merge'] == 'right_only', merged['_merge'] == 'left_only'],
+                            ['added', 'removed'], 'changed'),
+        'changed_flags': changed_names(list(flag_columns)),
+        'changed_fields': changed_names(list(text_columns)),
+        'moved': moved,
+        'old_lon': old_lon, 'old_lat': old_lat,
+        'new_lon': new_lon, 'new_lat': new_lat,
+    })
+    touched = ~both | moved | (diff['changed_flags'] != '').to_numpy() | (diff['changed_fields'] != '').to_numpy()
+    return diff[touched].reset_index(drop=True)
+
+
+def changed_positions(diff):
+    """lon/lat of every position a diff touches (old and new place of moved rows)."""
+    positions = pd.concat([
+        diff[['old_lon', 'old_lat']].set_axis(['lon', 'lat'], axis=1),
+        diff[['new_lon', 'new_lat']].set_axis(['lon', 'lat'], axis=1),
+    ], ignore_index=True)
+    return positions.dropna().drop_duplicates().reset_index(drop=True)
+
+
+def print_diff_summary(diff):
+    counts = diff['change'].value_counts()
+    print(f"Registry diff: {counts.get('added', 0)} added, {counts.get('removed', 0)} removed, "
+          f"{counts.get('changed', 0)} changed ({int(diff['moved'].sum())} moved)")
+    for _, row in diff.iterrows():
+        details = [d for d in (row['changed_flags'], row['changed_fields']) if d]
+        if row['moved']:
+            details.append('moved')
+        suffix = f" ({'; '.join(details)})" if details else ''
+        print(f"  {row['change']:<8} {row['Institution']}{suffix}")
+
+
+# Change styles for the overlay map: marker, colour, legend label
+change_styles = {
+    'added': ('P', '#1E4611', 'Added'),
+    'removed': ('X', '#CD1A1B', 'Removed'),
+    'changed': ('o', '#0F1F2C', 'Changed flags or details'),
+}
+
+
+def create_change_map(diff, boundaries, southern_africa=None):
+    """Overview map of a registry diff: added, removed, changed and moved institutions."""
+    import matplotlib.pyplot as plt
+    import matplotlib.lines as mlines
+
+    print("Creating what-changed map")
+    fig, ax = plt.subplots(figsize=(10, 8))
+    boundaries.plot(ax=ax, color='white', edgecolor='gray', linewidth=0.3, alpha=0.9)
+    if southern_africa is not None:
+        southern_africa.plot(ax=ax, color='white', edgecolor='darkgray', linewidth=0.5, alpha=0.9)
+
+    # Moves are drawn as arrows from the old to the new position
+    moved = diff[diff['moved']].dropna(subset=['old_lon', 'old_lat', 'new_lon', 'new_lat'])
+    for _, row in moved.iterrows():
+        ax.annotate('', xy=(row['new_lon'], row['new_lat']), xytext=(row['old_lon'], row['old_lat']),
+                    arrowprops=dict(arrowstyle='->', color='#90876E', linewidth=1.2), zorder=9)
+
+    handles = []
+    for change, (marker, color, label) in change_styles.items():
+        rows = diff[diff['change'] == change]
+        prefix = 'old' if change == 'removed' else 'new'
+        if len(rows):
+            ax.scatter(rows[f"{prefix}_lon"], rows[f"{prefix}_lat"], marker=marker, c=color, s=60,
+                       edgecolor='black', linewidth=0.5, zorder=10)
+        handles.append(mlines.Line2D([], [], color=color, marker=marker, linestyle='None',
+                                     markersize=7, label=f"{label} ({len(rows)})"))
+    handles.append(mlines.Line2D([], [], color='#90876E', marker=r'$\rightarrow$', linestyle='None',
+                                 markersize=10, label=f"Moved ({len(moved)})"))
+
+    # Southern Africa like the main map, widened to include every change
+    positions = changed_positions(diff)
+    xmin, xmax, ymin, ymax = 10, 40, -35, 0
+    if len(positions):
+        xmin = min(xmin, positions['lon'].min() - 2)
+        xmax = max(xmax, positions['lon'].max() + 2)
+        ymin = min(ymin, positions['lat'].min() - 2)
+        ymax = max(ymax, positions['lat'].max() + 2)
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+
+    ax.legend(handles=handles, loc='lower right', frameon=True, framealpha=0.9, edgecolor='gray', fontsize=8)
+    ax.set_title("What changed in the partner registry", fontsize=14, fontweight='bold')
+    ax.axis('off')
+    return fig, ax
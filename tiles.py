@@ -0,0 +1,332 @@
+import io
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+import xyzservices.providers as xyz
+from matplotlib.image import imread, imsave
+from requests.adapters import HTTPAdapter
+from xyzservices import TileProvider
+
+# Basemap tile fetching for the inset maps.
+#
+# Tiles are downloaded concurrently over one pooled requests.Session. Each tile
+# is retried on its own and falls back to the next provider on its own, so one
+# bad tile no longer restarts the whole bbox against another provider. Hosts
+# with a usage policy on concurrent connections get at most that many requests
+# at a time, however many workers are running. The LocalTileServer stand-in serves tiles from a directory (or generated ones)
+# over HTTP so the fetch path can be exercised without network access.
+
+TILE_SIZE = 256
+
+# Providers tried per tile, in order (Stamen tiles are now hosted by Stadia)
+default_tile_providers = ['Stadia.StamenTerrain', 'CartoDB.Positron', 'OpenStreetMap.Mapnik']
+
+USER_AGENT = 'Wellcome_climate_center maps (python-requests)'
+
+# Most concurrent requests per tile host (and its subdomains), process-wide; the
+# OpenStreetMap tile usage policy allows two connections
+HOST_CONNECTION_LIMITS = {'openstreetmap.org': 2}
+
+# Most detailed zoom used for basemaps (street level for a metro inset)
+MAX_ZOOM = 13
+
+# Most tiles fetched for one basemap; 256 RGBA tiles make a 64 MB mosaic, and
+# staying below TILE_CACHE_SIZE lets a whole basemap stay cached
+MAX_TILES = 256
+
+# Decoded tiles kept in memory for long-running processes (watch mode, render
+# service); 512 RGBA tiles is about 128 MB
+TILE_CACHE_SIZE = 512
+
+_tile_cache = OrderedDict()
+_tile_cache_lock = threading.Lock()
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def resolve_providers(providers=None):
+    """TileProvider objects for a list of provider names or objects, skipping unknown names."""
+    resolved = []
+    for provider in providers or default_tile_providers:
+        if isinstance(provider, TileProvider):
+            resolved.append(provider)
+            continue
+        try:
+            resolved.append(xyz.query_name(provider))
+        except ValueError:
+            print(f"Unknown tile provider {provider}, skipping")
+    return resolved
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Fractional XYZ tile coordinates of a lon/lat point."""
+    n = 2 ** zoom
+    lat = np.clip(lat, -85.0511, 85.0511)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2.0 * n
+    return x, y
+
+
+def tile_to_lonlat(x, y, zoom):
+    """Lon/lat of the north-west corner of tile (x, y)."""
+    n = 2 ** zoom
+    lon = x / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / n))))
+    return lon, lat
+
+
+def tile_range(west, south, east, north, zoom):
+    """Tile index ranges (x0, x1, y0, y1), inclusive, covering a lon/lat bbox."""
+    x0, y0 = lonlat_to_tile(west, north, zoom)
+    x1, y1 = lonlat_to_tile(east, south, zoom)
+    last = 2 ** zoom - 1
+    return (max(int(math.floor(x0)), 0), min(int(math.floor(x1)), last),
+            max(int(math.floor(y0)), 0), min(int(math.floor(y1)), last))
+
+
+def tile_count(west, south, east, north, zoom):
+    x0, x1, y0, y1 = tile_range(west, south, east, north, zoom)
+    return (x1 - x0 + 1) * (y1 - y0 + 1)
+
+
+def zoom_for_extent(west, south, east, north, width_px, max_zoom=MAX_ZOOM, max_tiles=MAX_TILES):
+    """Lowest zoom whose tiles cover the extent with at least width_px pixels across,
+    lowered further if that would take more than max_tiles tiles."""
+    needed = width_px * 360.0 / (max(east - west, 1e-9) * TILE_SIZE)
+    zoom = int(np.clip(math.ceil(math.log2(max(needed, 1))), 0, max_zoom))
+    while zoom > 0 and tile_count(west, south, east, north, zoom) > max_tiles:
+        zoom -= 1
+    return zoom
+
+
+def make_session(pool_size=16):
+    """requests.Session with a connection pool large enough for the worker threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def _decode_tile(content):
+    image = imread(io.BytesIO(content), format='png' if content[:4] == b'\x89PNG' else 'jpg')
+    if image.dtype != np.uint8:
+        image = (image * 255).round().astype(np.uint8)
+    if image.ndim == 2:
+        image = np.stack([image] * 3, axis=-1)
+    if image.shape[2] == 3:
+        image = np.dstack([image, np.full(image.shape[:2], 255, dtype=np.uint8)])
+    return image
+
+
+def host_slot(url):
+    """Semaphore limiting concurrent requests to url's host, or a no-op context for unlimited hosts."""
+    host = urlparse(url).hostname or ''
+    for domain, limit in HOST_CONNECTION_LIMITS.items():
+        if host == domain or host.endswith('.' + domain):
+            with _host_slots_lock:
+                return _host_slots.setdefault(domain, threading.BoundedSemaphore(limit))
+    return nullcontext()
+
+
+def fetch_tile(session, providers, x, y, zoom, retries=2, timeout=10):
+    """One tile as an RGBA array, trying each provider in turn with per-tile retries."""
+    for provider in providers:
+        url = provider.build_url(x=x, y=y, z=zoom)
+        slot = host_slot(url)
+        for attempt in range(retries + 1):
+            try:
+                with slot:
+                    response = session.get(url, timeout=timeout)
+                if response.status_code == 200:
+                    return _decode_tile(response.content)
+                # Client errors (missing key, tile outside coverage) will not improve on retry
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    break
+            except (requests.RequestException, ValueError, OSError):
+                pass
+            if attempt < retries:
+                time.sleep(0.2 * 2 ** attempt)
+    return None
+
+
+def _cache_get(key):
+    with _tile_cache_lock:
+        image = _tile_cache.get(key)
+        if image is not None:
+            _tile_cache.move_to_end(key)
+        return image
+
+
+def _cache_put(key, image):
+    with _tile_cache_lock:
+        _tile_cache[key] = image
+        _tile_cache.move_to_end(key)
+        while len(_tile_cache) > TILE_CACHE_SIZE:
+            _tile_cache.popitem(last=False)
+
+
+def clear_tile_cache():
+    with _tile_cache_lock:
+        _tile_cache.clear()
+
+
+def fetch_tiles(west, south, east, north, zoom, providers=None, max_workers=8,
+                retries=2, session=None, max_tiles=MAX_TILES):
+    """Mosaic of all tiles covering a lon/lat bbox, fetched in parallel.
+
+    Returns the RGBA image and its lon/lat extent (west, east, south, north).
+    Tiles that fail on every provider are left transparent; if none succeed,
+    or the bbox needs more than max_tiles tiles at this zoom, a RuntimeError is
+    raised so callers can fall back to a static basemap.
+    """
+    providers = resolve_providers(providers)
+    if not providers:
+        raise RuntimeError("No usable tile providers")
+
+    x0, x1, y0, y1 = tile_range(west, south, east, north, zoom)
+    tiles = [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+    if len(tiles) > max_tiles:
+        raise RuntimeError(f"Basemap needs {len(tiles)} tiles at zoom {zoom}, more than the limit of "
+                           f"{max_tiles}; use a lower zoom (see zoom_for_extent)")
+
+    # Tiles already in memory are reused; only the rest go over the network
+    source = tuple(provider.get('url') for provider in providers)
+    images = [_cache_get((source, zoom, x, y)) for x, y in tiles]
+    todo = [i for i, image in enumerate(images) if image is None]
+    print(f"Fetching {len(todo)} of {len(tiles)} tiles at zoom {zoom} with {max_workers} workers")
+
+    if todo:
+        own_session = session is None
+        if own_session:
+            session = make_session(max_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                fetched = pool.map(
+                    lambda i: fetch_tile(session, providers, tiles[i][0], tiles[i][1], zoom, retries), todo)
+                for i, image in zip(todo, fetched):
+                    images[i] = image
+                    if image is not None:
+                        _cache_put((source, zoom) + tiles[i], image)
+        finally:
+            if own_session:
+                session.close()
+
+    failed = sum(image is None for image in images)
+    if failed == len(tiles):
+        raise RuntimeError(f"All {len(tiles)} tiles failed for every provider")
+    if failed:
+        print(f"WARNING: {failed} of {len(tiles)} tiles could not be fetched")
+
+    mosaic = np.zeros(((y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE, 4), dtype=np.uint8)
+    for (x, y), image in zip(tiles, images):
+        if image is None:
+            continue
+        row, col = (y - y0) * TILE_SIZE, (x - x0) * TILE_SIZE
+        mosaic[row:row + TILE_SIZE, col:col + TILE_SIZE] = image[:TILE_SIZE, :TILE_SIZE]
+
+    tile_west, tile_north = tile_to_lonlat(x0, y0, zoom)
+    tile_east, tile_south = tile_to_lonlat(x1 + 1, y1 + 1, zoom)
+    return mosaic, (tile_west, tile_east, tile_south, tile_north)
+
+
+# Local stand-in tile server
+
+class _TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        try:
+            z, x = int(parts[0]), int(parts[1])
+            y = int(os.path.splitext(parts[2])[0])
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+
+        tile_dir = self.server.tile_dir
+        if tile_dir is not None:
+            path = os.path.join(tile_dir, str(z), str(x), f"{y}.png")
+            if not os.path.exists(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                body = f.read()
+        else:
+            body = self.server.generated_tile(z, x, y)
+
+        self.server.requests_served += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalTileServer:
+    """XYZ tile server on 127.0.0.1 for offline runs and tests.
+
+    Serves {tile_dir}/{z}/{x}/{y}.png when tile_dir is given, otherwise a plain
+    generated tile for every request. Use as a context manager and pass
+    server.provider wherever a tile provider is accepted.
+    """
+
+    def __init__(self, tile_dir=None, port=0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), _TileHandler)
+        self.httpd.tile_dir = tile_dir
+        self.httpd.requests_served = 0
+        self.httpd.generated_tile = self._generated_tile
+        self._thread = None
+        self._blank = None
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def requests_served(self):
+        return self.httpd.requests_served
+
+    @property
+    def provider(self):
+        return TileProvider(
+            name='LocalTileServer',
+            url=f"http://127.0.0.1:{self.port}/{{z}}/{{x}}/{{y}}.png",
+            attribution='Local test tiles',
+        )
+
+    def _generated_tile(self, z, x, y):
+        if self._blank is None:
+            tile = np.full((TILE_SIZE, TILE_SIZE, 3), 235, dtype=np.uint8)
+            tile[0, :] = tile[:, 0] = 200  # faint grid so tile seams are visible
+            buffer = io.BytesIO()
+            imsave(buffer, tile, format='png')
+            self._blank = buffer.getvalue()
+        return self._blank
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,178 @@
+import json
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from gazetteer import normalize_place, normalize_places
+
+# Validation of the partner registry (base.csv) before anything is rendered.
+#
+# Every check works on whole columns at once so the stage stays cheap on large
+# registries. Problems are collected as one record per (row, check) and returned
+# as a report dict that can be dumped to JSON for CI or other tools.
+
+# 0/1 indicator columns of base.csv
+FLAG_COLUMNS = [
+    'Official Partners', 'CHAMNHA', 'HEAT', 'ENBEL', 'GHAP', 'HAPI', 'BioHEAT',
+    'HIGH_Horizons', 'Funder', 'Partners', 'Data_Providers', 'Government Partners',
+    'Policy', 'Research', 'Engagement, Advocacy, and Capacity Building',
+    'Finance_programmes', 'Gueladio_Cisse', 'Matthew_Chersich', 'Pilot_Projects'
+]
+
+TEXT_COLUMNS = ['Institution', 'City', 'Country', 'Short_Name']
+
+# Registry country names that are spelled differently in naturalearth_lowres
+boundary_country_names = {
+    "United States": "United States of America",
+    "Eswatini": "eSwatini",
+    "Swaziland": "eSwatini",
+    "Cote d'Ivoire": "Côte d'Ivoire",
+    "Ivory Coast": "Côte d'Ivoire",
+}
+
+# Replacement characters and the usual UTF-8-read-as-Latin-1 sequences
+ENCODING_DAMAGE_PATTERN = '�|Ã[\x80-\xbf]|Â[\x80-\xbf]|â€'
+
+# Distance (degrees) a point may lie outside its country polygon; the low
+# resolution boundaries cut off coastal cities such as Cape Town or Dakar
+COUNTRY_TOLERANCE = 0.25
+
+
+def _issues(data, mask, check, detail):
+    # One report record per row selected by mask
+    rows = data.index[np.asarray(mask, dtype=bool)]
+    if isinstance(detail, pd.Series):
+        detail = detail.loc[rows].astype(str).to_numpy()
+    return pd.DataFrame({
+        'row': rows,
+        'institution': data.loc[rows, 'Institution'].to_numpy() if 'Institution' in data else None,
+        'check': check,
+        'detail': detail,
+    })
+
+
+def check_flags(data):
+    columns = [col for col in FLAG_COLUMNS if col in data.columns]
+    raw = data[columns]
+    values = raw.apply(pd.to_numeric, errors='coerce')
+    # Empty cells are tolerated (optional columns); anything else must be 0 or 1
+    invalid = raw.notna() & ~values.isin([0, 1])
+    invalid = invalid.stack()
+    invalid = invalid[invalid]
+    rows = invalid.index.get_level_values(0)
+    columns = invalid.index.get_level_values(1)
+    detail = [f"{col}={data.at[row, col]!r}" for row, col in zip(rows, columns)]
+    return pd.DataFrame({
+        'row': rows,
+        'institution': data.loc[rows, 'Institution'].to_numpy(),
+        'check': 'flag_not_binary',
+        'detail': detail,
+    })
+
+
+def check_duplicates(data):
+    names = normalize_places(data['Institution'])
+    duplicated = (names != '') & names.duplicated(keep=False)
+    return _issues(data, duplicated, 'duplicate_institution', 'institution appears more than once')
+
+
+def check_encoding(data):
+    found = []
+    for col in [c for c in TEXT_COLUMNS if c in data.columns]:
+        damaged = data[col].astype('string').str.contains(ENCODING_DAMAGE_PATTERN, regex=True).fillna(False)
+        found.append(_issues(data, damaged, 'encoding_damage', col + ': ' + data[col].astype(str)))
+    return pd.concat(found, ignore_index=True)
+
+
+def check_coordinates(data, world=None, tolerance=COUNTRY_TOLERANCE):
+    lon = pd.to_numeric(data['lon'], errors='coerce')
+    lat = pd.to_numeric(data['lat'], errors='coerce')
+
+    missing = lon.isna() | lat.isna()
+    out_of_range = ~missing & ((lon.abs() > 180) | (lat.abs() > 90))
+    found = [
+        _issues(data, missing, 'missing_coordinates', 'lon/lat empty'),
+        _issues(data, out_of_range, 'coordinates_out_of_range',
+                'lon=' + lon.astype(str) + ', lat=' + lat.astype(str)),
+    ]
+    if world is None:
+        return pd.concat(found, ignore_index=True)
+
+    # Map stated countries onto boundary polygons
+    boundary_names = {normalize_place(name): name for name in world['name']}
+    boundary_names.update({normalize_place(k): v for k, v in boundary_country_names.items()})
+    countries = data['Country'].dropna().unique()
+    stated = data['Country'].map({c: boundary_names.get(normalize_place(c)) for c in countries})
+    unknown = stated.isna() & data['Country'].notna()
+    found.append(_issues(data, unknown, 'unknown_country',
+                         'no boundary for ' + data['Country'].astype(str)))
+
+    testable = ~missing & ~out_of_range & stated.notna()
+    if not testable.any():
+        return pd.concat(found, ignore_index=True)
+
+    polygons = world[['name', 'geometry']].reset_index(drop=True)
+    points = gpd.GeoDataFrame(
+        {'stated': stated[testable]},
+        geometry=gpd.points_from_xy(lon[testable], lat[testable]),
+        crs=world.crs,
+    )
+
+    # Point-in-polygon for all rows through the spatial index
+    joined = gpd.sjoin(points, polygons, how='left', predicate='within')
+    joined = joined[~joined.index.duplicated(keep='first')]
+    actual = joined['name'].reindex(points.index)
+    mismatch = actual.ne(points['stated'])
+
+    # Only the mismatches need the (slower) distance to their stated country
+    if mismatch.any():
+        suspects = points[mismatch]
+        # Plain degrees are fine here, the tolerance is only a coarse margin
+        stated_shapes = polygons.set_index('name').geometry.reindex(suspects['stated']).to_numpy()
+        near = shapely.distance(suspects.geometry.to_numpy(), stated_shapes) <= tolerance
+        swapped_points = gpd.points_from_xy(lat[suspects.index], lon[suspects.index])
+        swapped = ~near & (shapely.distance(np.asarray(swapped_points), stated_shapes) <= tolerance)
+        near = pd.Series(near, index=suspects.index)
+        swapped = pd.Series(swapped, index=suspects.index)
+        outside = ~near & ~swapped
+
+        found.append(_issues(data, data.index.isin(swapped[swapped].index), 'swapped_lon_lat',
+                             'point lies in ' + data['Country'].astype(str) + ' only with lon/lat swapped'))
+        located = actual.reindex(data.index).fillna('no country')
+        found.append(_issues(data, data.index.isin(outside[outside].index), 'outside_country',
+                             'stated ' + data['Country'].astype(str) + ', point in ' + located))
+
+    return pd.concat(found, ignore_index=True)
+
+
+def validate_registry(data, world=None):
+    """Run all registry checks and return a machine-readable report dict."""
+    issues = pd.concat([
+        check_flags(data),
+        check_duplicates(data),
+        check_encoding(data),
+        check_coordinates(data, world),
+    ], ignore_index=True)
+    issues = issues.sort_values(['row', 'check'], kind='stable')
+    issues['row'] = issues['row'].astype(int)
+
+    return {
+        'rows': int(len(data)),
+        'issue_count': int(len(issues)),
+        'counts': {check: int(n) for check, n in issues['check'].value_counts().items()},
+        'issues': issues.to_dict(orient='records'),
+    }
+
+
+def print_validation_summary(report):
+    print(f"Validation: {report['issue_count']} issues in {report['rows']} rows")
+    for check, count in sorted(report['counts'].items()):
+        print(f"  {check}: {count}")
+
+
+def write_validation_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Validation report written to {path}")
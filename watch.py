@@ -0,0 +1,253 @@
+import os
+import time
+
+import numpy as np
+
+import create_map
+from colocation import displaced_xy
+from density import should_aggregate
+from insets import discover_insets
+from layout import main_map_colocation_radius, main_map_extent, main_map_labels
+from proximity import EARTH_RADIUS_KM, NEIGHBOUR_RADIUS_KM
+from snapshots import changed_positions, content_hash, diff_registry
+
+# Watch mode: a long-running process that keeps the parsed registry, boundary
+# layers, basemap tiles and the figures it has drawn in memory, polls base.csv
+# (and the gazetteer) for changes, and re-renders only the outputs that the
+# changed rows can affect.
+#
+# A figure is redrawn when a changed row lies in (or near enough to change the
+# markers in) its visible area, or when one of its inputs that depends on the
+# whole registry changed: the label layout and aggregation of the main maps,
+# the area rows of an inset, and the per-focus-area counts and colours of the
+# simplified overlay on the first inset.
+
+# Columns whose values decide how a row is drawn ('Official Partners' sizes the overlay markers)
+DRAWN_COLUMNS = ['Institution', 'lon', 'lat', 'FocusType', 'Shape', 'is_major_partner',
+                 'offset_dx', 'offset_dy', 'Official Partners']
+
+MAIN_OUTPUTS = ['southern_africa_map', 'southern_africa_map_with_boxes']
+LAYOUT_OUTPUTS = ['southern_africa_combined', 'southern_africa_dashboard']
+
+
+def changed_points(old_data, new_data):
+    """lon/lat of rows added, removed or redrawn between two loads (both positions for moves)."""
+    drawn = [c for c in DRAWN_COLUMNS if c not in ('Institution', 'lon', 'lat')
+             and c in old_data.columns and c in new_data.columns]
+    return changed_positions(diff_registry(old_data, new_data, flag_columns=[], text_columns=drawn))
+
+
+def _neighbour_margin(extent):
+    # Degrees that cover the marker-size proximity radius anywhere in extent
+    xmin, xmax, ymin, ymax = extent
+    lat = min(max(abs(ymin), abs(ymax)), 80)
+    return NEIGHBOUR_RADIUS_KM / (EARTH_RADIUS_KM * np.radians(1) * np.cos(np.radians(lat)))
+
+
+def _view_margin(extent):
+    # An inset view pads its points by a fifth of their range (at least 0.05 degrees), and
+    # co-located points are spread a little further
+    xmin, xmax, ymin, ymax = extent
+    return 0.25 * max(xmax - xmin, ymax - ymin) + 0.05
+
+
+def _touches(points, extent, margin):
+    xmin, xmax, ymin, ymax = extent
+    return bool((points['lon'].between(xmin - margin, xmax + margin)
+                 & points['lat'].between(ymin - margin, ymax + margin)).any())
+
+
+def main_map_inputs(data):
+    """Inputs of the overview map that changed rows outside its extent can still alter."""
+    xmin, xmax, ymin, ymax = main_map_extent
+    aggregated = should_aggregate(len(data))
+    plot_x, plot_y = displaced_xy(data, main_map_colocation_radius)
+    labels = main_map_labels(data.assign(plot_x=plot_x, plot_y=plot_y), aggregated)
+    in_view = (labels['plot_x'].between(xmin, xmax) & labels['plot_y'].between(ymin, ymax)
+               & labels['label_x'].between(xmin, xmax) & labels['label_y'].between(ymin, ymax))
+    layout = labels.loc[in_view, ['Institution', 'plot_x', 'plot_y', 'label_x', 'label_y']]
+    # The legend of an aggregated map counts every institution
+    return aggregated, len(data) if aggregated else None, list(layout.itertuples(index=False, name=None))
+
+
+def inset_map_inputs(data, inset, overlay=False):
+    """Inputs of an inset map other than the rows near its area, and the box its area covers."""
+    area_data, box = create_map.inset_area_data(data, inset['bbox'], inset['name'])
+    area_data = area_data[[c for c in DRAWN_COLUMNS if c in area_data.columns]]
+    inputs = (inset['name'], tuple(box), content_hash(area_data.reset_index(drop=True)))
+    if overlay:
+        # The overlay colours focus areas in order of appearance and counts them in its legend
+        counts = data['FocusType'].value_counts()
+        categories = tuple(data['FocusType'].unique())
+        aggregated = should_aggregate(len(data))
+        inputs += (categories, tuple(int(counts.get(c, 0)) for c in categories),
+                   aggregated, len(data) if aggregated else None)
+    return inputs, box
+
+
+def _boxes(insets):
+    return [(inset['slug'], inset['name'], list(inset['bbox']), inset['color']) for inset in insets]
+
+
+def affected_outputs(old_data, new_data, old_insets, new_insets):
+    """Output names that have to be redrawn after the registry changed."""
+    points = changed_points(old_data, new_data)
+    affected = set()
+
+    extent = main_map_extent
+    if _touches(points, extent, _neighbour_margin(extent)) or main_map_inputs(old_data) != main_map_inputs(new_data):
+        affected.update(MAIN_OUTPUTS)
+    elif _boxes(old_insets) != _boxes(new_insets):
+        affected.add('southern_africa_map_with_boxes')
+
+    # The simplified overlay is drawn on the first inset
+    old_positions = {inset['slug']: (i, inset) for i, inset in enumerate(old_insets)}
+    for i, inset in enumerate(new_insets):
+        name = f"{inset['slug']}_map"
+        if inset['slug'] not in old_positions or old_positions[inset['slug']][0] != i:
+            affected.add(name)
+            continue
+        old_inputs, _ = inset_map_inputs(old_data, old_positions[inset['slug']][1], overlay=i == 0)
+        new_inputs, box = inset_map_inputs(new_data, inset, overlay=i == 0)
+        if old_inputs != new_inputs or _touches(points, box, _view_margin(box) + _neighbour_margin(box)):
+            affected.add(name)
+
+    # Layouts show the main maps and every inset, in inset order
+    insets_changed = ([i['slug'] for i in old_insets] != [i['slug'] for i in new_insets]
+                      or any(f"{inset['slug']}_map" in affected for inset in new_insets))
+    if insets_changed or 'southern_africa_map_with_boxes' in affected:
+        affected.add('southern_africa_combined')
+    if insets_changed or 'southern_africa_map' in affected:
+        affected.add('southern_africa_dashboard')
+    return affected
+
+
+class MapWatcher:
+    """Re-renders the map outputs whenever the registry or gazetteer changes."""
+
+    def __init__(self, data_path, output_dir="python_maps", gazetteer_file=None,
+                 interval=0.5, snapshot_dir=None):
+        self.data_path = data_path
+        self.output_dir = output_dir
+        self.gazetteer_file = gazetteer_file
+        self.interval = interval
+        self.snapshot_dir = snapshot_dir
+
+        self.data = None
+        self.insets = []
+        self.figures = {}
+        self.africa = None
+        self.southern_africa = None
+        self._stamps = {}
+
+    def _stamp(self, path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _changed_paths(self):
+        paths = [self.data_path]
+        if self.gazetteer_file:
+            paths.append(self.gazetteer_file)
+        stamps = {path: self._stamp(path) for path in paths}
+        changed = [path for path in paths if stamps[path] != self._stamps.get(path)]
+        self._stamps = stamps
+        return changed
+
+    def _load(self):
+        report_path = os.path.join(self.output_dir, "validation_report.json")
+        return create_map.load_data(self.data_path, self.gazetteer_file, report_path,
+                                    snapshot_dir=self.snapshot_dir)
+
+    def render(self, names):
+        """Redraw and save the named outputs; figures the layouts need are drawn if missing."""
+        plt = create_map._pyplot()
+        names = set(names)
+        inset_names = [f"{inset['slug']}_map" for inset in self.insets]
+        needed = set(names)
+        if needed & set(LAYOUT_OUTPUTS):
+            needed.update(name for name in MAIN_OUTPUTS + inset_names if name not in self.figures)
+
+        main_names = [name for name in MAIN_OUTPUTS if name in needed]
+        if main_names:
+            self._replace(create_map.build_main_maps(self.data, self.africa, self.southern_africa,
+                                                     self.insets, main_names))
+
+        wanted = [name for name in inset_names if name in needed]
+        if wanted:
+            self._replace(create_map.build_inset_maps(self.data, self.insets, wanted))
+        # Insets that no longer exist are dropped from memory
+        for name in [n for n in self.figures if n.endswith('_map') and n not in inset_names
+                     and n not in MAIN_OUTPUTS]:
+            plt.close(self.figures.pop(name))
+
+        inset_figs = [self.figures[name] for name in inset_names]
+        if 'southern_africa_combined' in names:
+            self._replace({'southern_africa_combined': create_map.create_combined_layout(
+                self.figures['southern_africa_map_with_boxes'], inset_figs)})
+        if 'southern_africa_dashboard' in names:
+            self._replace({'southern_africa_dashboard': create_map.create_dashboard(
+                self.figures['southern_africa_map'], inset_figs, [inset['name'] for inset in self.insets])})
+
+        for name in sorted(names & set(self.figures)):
+            formats = ('pdf', 'png') if name in inset_names else ('pdf',)
+            create_map.save_figure(self.figures[name], self.output_dir, name, formats)
+
+    def _replace(self, figures):
+        plt = create_map._pyplot()
+        for name, fig in figures.items():
+            old = self.figures.get(name)
+            if old is not None and old is not fig:
+                plt.close(old)
+            self.figures[name] = fig
+
+    def build(self):
+        """Initial full build; boundaries and imports stay warm afterwards."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._changed_paths()
+        self.data = self._load()
+        if self.data is None:
+            return False
+        _, self.africa, self.southern_africa = create_map.load_map_data()
+        if self.africa is None:
+            return False
+        self.insets = discover_insets(self.data)
+        self.render(MAIN_OUTPUTS + [f"{inset['slug']}_map" for inset in self.insets] + LAYOUT_OUTPUTS)
+        return True
+
+    def refresh(self):
+        """Check the watched files once; re-render what changed. Returns the outputs redrawn."""
+        changed = self._changed_paths()
+        if not changed:
+            return set()
+
+        start = time.perf_counter()
+        print(f"Changed: {', '.join(changed)}")
+        new_data = self._load()
+        if new_data is None:
+            print("Keeping previous outputs, the registry could not be loaded")
+            return set()
+        new_insets = discover_insets(new_data)
+
+        names = affected_outputs(self.data, new_data, self.insets, new_insets)
+
+        self.data, self.insets = new_data, new_insets
+        if names:
+            self.render(names)
+        print(f"Re-rendered {len(names)} outputs in {time.perf_counter() - start:.2f}s: "
+              f"{', '.join(sorted(names)) or 'nothing affected'}")
+        return names
+
+    def run(self):
+        if not self.build():
+            return 1
+        print(f"Watching {self.data_path} for changes (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.refresh()
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        return 0